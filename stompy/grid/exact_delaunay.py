@@ -3,6 +3,7 @@
 # the algorithm of CGAL to the extent possible.
 import logging
 import pdb
+import collections
 logger = logging.getLogger()
 
 import six
@@ -12,7 +13,6 @@ import matplotlib.pyplot as plt
 # do these work in py2?
 from ..spatial import robust_predicates
 from . import unstructured_grid
-from ..utils import circular_pairs
 
 try:
     from scipy import spatial
@@ -30,6 +30,95 @@ class IntersectingConstraints(BadConstraint):
 class ConstraintCollinearNode(BadConstraint):
     pass
 
+FieldViews=collections.namedtuple('FieldViews',
+                                  ['cells_nodes','cells_edges',
+                                   'edges_nodes','edges_cells','edges_constrained',
+                                   'nodes_x'])
+
+def locate_walk(c,t,cells_nodes,cells_edges,edges_cells,nodes_x):
+    """
+    The straight walk of Triangulation.locate(), operating on plain arrays
+    so that the loop doesn't go through any grid methods.
+
+    c: index of a valid starting cell
+    t: target point, as a pair of python floats
+    cells_nodes, cells_edges, edges_cells, nodes_x: the respective fields
+     of the grid's cells, edges and nodes arrays.
+
+    returns (c,o0,o1,o2,last_edge,last_nodes):
+     if t lies in or on the boundary of cell c, c>=0 and o0,o1,o2 are the
+     orientations of t with respect to the three edges of c.
+     if the walk left the triangulation, c is negative, o0,o1,o2 are None,
+     and last_edge and last_nodes give the edge crossed, and its nodes in CCW
+     order with respect to the last valid cell.
+    """
+    orient=robust_predicates.orient2d_filter
+    tx,ty=t
+    last_edge=None
+    last_nodes=None
+    # index within c of the edge we arrived through.  t is known to be
+    # strictly to its left, so it needn't be tested again.
+    # (CGAL skips this too, Triangulation_2.h:2616)
+    skip=-1
+
+    while c>=0:
+        # nodes are stored in CCW order for the cell.
+        # 1st edge connects first two nodes
+        # node ids as python ints, and scalar row reads rather than
+        # fancy indexing, which would allocate a new array per hop
+        n0,n1,n2=cells_nodes[c].tolist()
+        x0,y0=nodes_x[n0].tolist()
+        x1,y1=nodes_x[n1].tolist()
+        x2,y2=nodes_x[n2].tolist()
+
+        # orientations are only computed until one comes up CW
+        o0=1 if skip==0 else orient(x0,y0,x1,y1,tx,ty)
+        if o0 == -1: # CW
+            k=0 ; last_nodes=(n0,n1)
+        else:
+            o1=1 if skip==1 else orient(x1,y1,x2,y2,tx,ty)
+            if o1 == -1:
+                k=1 ; last_nodes=(n1,n2)
+            else:
+                o2=1 if skip==2 else orient(x2,y2,x0,y0,tx,ty)
+                if o2 == -1:
+                    k=2 ; last_nodes=(n2,n0)
+                else:
+                    # must be in or on a face
+                    return c,o0,o1,o2,last_edge,last_nodes
+        # step to the cell on the other side of edge k
+        last_edge=cells_edges[c,k]
+        c1,c2=edges_cells[last_edge].tolist()
+        if c1==c:
+            c=c2
+        else:
+            c=c1
+        if c>=0:
+            e0,e1,e2=cells_edges[c].tolist()
+            if e0==last_edge:
+                skip=0
+            elif e1==last_edge:
+                skip=1
+            else:
+                skip=2
+    return c,None,None,None,last_edge,last_nodes
+
+def edge_key(n1,n2):
+    """ single integer key for the unordered node pair n1,n2 """
+    if n1<n2:
+        return (n1<<32) | n2
+    else:
+        return (n2<<32) | n1
+
+def ordered(x1x,x1y,x2x,x2y,x3x,x3y):
+    """ given collinear points x1,x2,x3, true if x2 falls between x1
+    and x3, compared along the dominant axis of x1-x3
+    """
+    if abs(x3x-x1x) >= abs(x3y-x1y):
+        return (x2x-x1x)*(x3x-x2x) >= 0.0
+    else:
+        return (x2y-x1y)*(x3y-x2y) >= 0.0
+
 class Triangulation(unstructured_grid.UnstructuredGrid):
     """ 
     Mimics the Triangulation_2 class of CGAL.
@@ -50,7 +139,7 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
     post_check=False # enables [expensive] checks after operations
     
     edge_dtype=(unstructured_grid.UnstructuredGrid.edge_dtype +
-                [ ('constrained',np.bool8) ] )
+                [ ('constrained',np.bool_) ] )
 
     def add_node(self,**kwargs):
         # will eventually need some caching or indexing to make
@@ -77,10 +166,9 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         # but adding the constraints back can fail, in which case we should
         # roll back our state, and fire an exception.
 
-        constraints_to_replace=[]
-        for j in self.node_to_edges(n):
-            if self.edges['constrained'][j]:
-                constraints_to_replace.append( self.edges['nodes'][j].copy() )
+        fv=self.field_views()
+        js=self._incident_halfedges(n)//2
+        constraints_to_replace=fv.edges_nodes[js[fv.edges_constrained[js]]].tolist()
 
         old_x=self.nodes['x'][n].copy() # in case of rollback
         
@@ -112,14 +200,67 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         j=super(Triangulation,self).add_edge(**kw)
         if 'cells' not in kw:
             self.edges[j]['cells'][:]=self.INF_CELL
+        if self._nodes_to_edge_map is not None:
+            n1,n2=self.edges['nodes'][j].tolist()
+            self._nodes_to_edge_map[edge_key(n1,n2)]=j
         return j
 
+    def delete_edge(self,j):
+        n1,n2=self.edges['nodes'][j].tolist()
+        super(Triangulation,self).delete_edge(j)
+        if self._nodes_to_edge_map is not None:
+            del self._nodes_to_edge_map[edge_key(n1,n2)]
+
+    def modify_edge(self,j,**kws):
+        if 'nodes' in kws and self._nodes_to_edge_map is not None:
+            n1,n2=self.edges['nodes'][j].tolist()
+            del self._nodes_to_edge_map[edge_key(n1,n2)]
+        super(Triangulation,self).modify_edge(j,**kws)
+        if 'nodes' in kws and self._nodes_to_edge_map is not None:
+            n1,n2=self.edges['nodes'][j].tolist()
+            self._nodes_to_edge_map[edge_key(n1,n2)]=j
+
+    def edge_replace_node(self,j,n_old,n_new):
+        self._nodes_to_edge_map=None
+        super(Triangulation,self).edge_replace_node(j,n_old,n_new)
+
+    # edge_key(n1,n2) => edge index for all valid edges.  Built on demand
+    # like node_to_edges, and maintained by add/delete/modify_edge.
+    _nodes_to_edge_map=None
+
+    def build_nodes_to_edge_map(self):
+        valid=np.nonzero(~self.edges['deleted'])[0]
+        en=self.edges['nodes'][valid].astype(np.int64)
+        keys=(en.min(axis=1)<<32) | en.max(axis=1)
+        self._nodes_to_edge_map=dict(zip(keys.tolist(),valid.tolist()))
+
+    def nodes_to_edge(self,n1,n2=None):
+        """ hash lookup, rather than intersecting node_to_edges lists.
+        returns None if there is no such edge.
+        """
+        if n2 is None:
+            n1,n2=n1
+        if self._nodes_to_edge_map is None:
+            self.build_nodes_to_edge_map()
+        return self._nodes_to_edge_map.get(edge_key(int(n1),int(n2)))
+
+    # KD-tree over node locations, used to seed locate() near the target
+    # ("jump-and-walk").  Rebuilt once enough nodes have been added.
+    _start_index=None
+    _start_index_nodes=None # map tree index => node index
+    _start_index_N=0 # Nnodes() when the tree was built
+
     def choose_start_cell(self,t=None):
         """ choose a starting cell for trying to locate where a new vertex
         should go.  May return INF_CELL if there are no valid cells.
         t: can specify a target point which may be used with a spatial index
         to speed up the query.
         """
+        if (t is not None) and (spatial is not None):
+            c=self.choose_start_cell_near(t)
+            if c is not None:
+                return c
+
         c=0
         try:
             while self.cells['deleted'][c]: 
@@ -127,13 +268,118 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
             return c
         except IndexError:
             return self.INF_CELL
-            
+
+    def choose_start_cell_near(self,t):
+        """ return a valid cell adjacent to the existing node nearest t,
+        or None if there isn't one.  The KD-tree is rebuilt when the number
+        of nodes has grown by more than sqrt(N) since the last build, so
+        the query may return a node which is not the very nearest.
+        """
+        N=self.Nnodes()
+        if (self._start_index is None) or (N-self._start_index_N)**2 > N:
+            valid=np.nonzero(~self.nodes['deleted'])[0]
+            if len(valid)==0:
+                return None
+            self._start_index=spatial.cKDTree(self.nodes['x'][valid])
+            self._start_index_nodes=valid
+            self._start_index_N=N
+
+        _,i=self._start_index.query(t)
+        n=self._start_index_nodes[i]
+        if n>=N or self.nodes['deleted'][n]:
+            return None
+        for c in self.node_to_cells(n):
+            if not self.cells['deleted'][c]:
+                return c
+        return None
+
+    # Plain ndarray views of the fields used in the inner loops.  Pulling a
+    # field out of a record array builds a new view on every access, so
+    # these are cached.  They share memory with the record arrays and so
+    # stay current, but are rebound whenever one of the arrays is replaced
+    # (append, truncate, renumber...)
+    _field_views=None
+    _field_views_key=None
+
+    def field_views(self):
+        """ returns a FieldViews tuple of cells_nodes, cells_edges, edges_nodes,
+        edges_cells, edges_constrained and nodes_x.  Writes to these
+        are writes to the grid.
+        """
+        key=self._field_views_key
+        if ( (key is None) or (key[0] is not self.nodes) or
+             (key[1] is not self.edges) or (key[2] is not self.cells) ):
+            self._field_views=FieldViews(cells_nodes=self.cells['nodes'],
+                                         cells_edges=self.cells['edges'],
+                                         edges_nodes=self.edges['nodes'],
+                                         edges_cells=self.edges['cells'],
+                                         edges_constrained=self.edges['constrained'],
+                                         nodes_x=self.nodes['x'])
+            self._field_views_key=(self.nodes,self.edges,self.cells)
+        return self._field_views
+
+    def _clear_caches(self):
+        """ drop the start-cell KD-tree, field views and nodes_to_edge map,
+        after node or edge ids have been rewritten wholesale.
+        """
+        self._start_index=None
+        self._field_views=self._field_views_key=None
+        self._nodes_to_edge_map=None
+
+    def refresh_metadata(self):
+        super(Triangulation,self).refresh_metadata()
+        self._clear_caches()
+
+    # renumbering doesn't go through refresh_metadata
+    def renumber_nodes(self):
+        super(Triangulation,self).renumber_nodes()
+        self._clear_caches()
+    def renumber_edges(self):
+        super(Triangulation,self).renumber_edges()
+        self._clear_caches()
+
+    def __getstate__(self):
+        d=super(Triangulation,self).__getstate__()
+        d['_start_index']=None
+        d['_field_views']=d['_field_views_key']=None
+        d['_nodes_to_edge_map']=None
+        return d
+
     IN_VERTEX=0
     IN_EDGE=2
     IN_FACE=3
     OUTSIDE_CONVEX_HULL=4
     OUTSIDE_AFFINE_HULL=5
 
+    def _incident_halfedges(self,n):
+        """ integer array of the half-edges leaving node n, each coded as
+        2*j+orient, such that edges['nodes'][j,orient]==n.  Not sorted.
+        """
+        js=np.asarray(self.node_to_edges(n),np.int32)
+        return 2*js + (self.field_views().edges_nodes[js,1]==n)
+
+    def halfedge_nbr(self,he,direc):
+        """ same as he.nbr(direc), but when he faces a cell the step is
+        taken within that cell, via cells['edges'], instead of sorting the
+        neighbors of a node.
+        direc: 0 for fwd, 1 for rev
+        """
+        fv=self.field_views()
+        c=fv.edges_cells[he.j,he.orient]
+        if c<0:
+            return he.nbr(direc)
+        k=fv.cells_nodes[c].tolist().index(fv.edges_nodes[he.j,he.orient])
+        j=fv.cells_edges[c,(k+1+direc)%3]
+        return self.halfedge(j,int(fv.edges_cells[j,0]!=c))
+
+    # (kind,index) for a point in or on cell c, indexed by the bits
+    # (o0==0) | (o1==0)<<1 | (o2==0)<<2 from locate().  For IN_EDGE the
+    # index is the edge's position in the cell, for IN_VERTEX the node's.
+    _locate_classify=( (IN_FACE,4),
+                       (IN_EDGE,0), (IN_EDGE,1), (IN_VERTEX,2),
+                       (IN_EDGE,2), (IN_VERTEX,0), (IN_VERTEX,1),
+                       None ) # collinear with all 3 edges - degenerate cell
+
     def dim(self):
         if len(self.cells) and not np.all(self.cells['deleted']):
             return 2
@@ -147,7 +393,7 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         if topo:
             return self.topo_sort_adjacent_nodes(n,ref_nbr)
         else:
-            return super(Triangulation,self).angle_sort_adjacent_ndoes(n,ref_nbr=ref_nbr)
+            return super(Triangulation,self).angle_sort_adjacent_nodes(n,ref_nbr=ref_nbr)
         
     def topo_sort_adjacent_nodes(self,n,ref_nbr=None):
         """ like angle_sort_adjacent_nodes, but relying on topology, not geometry.
@@ -157,27 +403,43 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         if len(nbrs)<3:
             snbrs=nbrs
         else:
-            he_nbrs = [ self.nodes_to_halfedge(n,nbr)
-                        for nbr in nbrs ]
-
-            map_next={}
-
-            for he in he_nbrs:
-                # this doesn't use angle_sort
-                c=he.cell_opp()
-                map_next[c] = (he.node_fwd(),he.cell())
-
-            trav0=trav=c
-
+            # each cell around n gives one step CCW around n:
+            # with n at index i of the cell, nbr i+1 is followed by nbr i+2.
+            cells_nodes=self.field_views().cells_nodes
+            nxt={}
+            for c in self.node_to_cells(n):
+                a,b,d=cells_nodes[c].tolist()
+                if a==n:
+                    nxt[b]=d
+                elif b==n:
+                    nxt[d]=a
+                else:
+                    nxt[a]=b
+            if len(nxt)==len(nbrs)-1:
+                # on the convex hull - the step across INF_CELL goes from
+                # the one nbr without a successor to the one without
+                # a predecessor.
+                last=set(nbrs).difference(nxt)
+                first=set(nbrs).difference(nxt.values())
+                nxt[last.pop()]=first.pop()
+            assert len(nxt)==len(nbrs)
+
+            if ref_nbr is None:
+                # start from the same place the half-edge traversal did
+                trav0=nbrs[-1]
+            elif ref_nbr in nxt:
+                # start at ref_nbr, rather than rotating afterwards
+                trav0=ref_nbr
+            else:
+                raise ValueError("%s is not a neighbor of %d"%(ref_nbr,n))
+            trav=trav0
             snbrs=[]
-            while 1:
-                #if len(snbrs)>20: # DBG
-                #    pdb.set_trace()
-                node,cell = map_next[trav]
-                snbrs.append(node)
-                trav=cell
-                if trav==trav0:
-                    break
+            for _ in range(len(nbrs)):
+                snbrs.append(trav)
+                trav=nxt[trav]
+            assert trav==trav0
+            if ref_nbr is not None:
+                return np.array(snbrs)
             
         if ref_nbr is not None: 
             i=list(snbrs).index(ref_nbr)
@@ -214,13 +476,6 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         """
         c=c or self.choose_start_cell(t)
 
-        prev=None # previous face
-        # To identify the right orientation of the half-edge, remember
-        # the ordering of the nodes -- this is CCW ordering from the 
-        # perspective of prev
-        last_nodes=None 
-        last_edge=None # the edge between c and prev
-
         # Checks for affine hull -
         # 3rd element gives the current dimensionality of the affine hull
         if self.Nnodes_valid()==0:
@@ -230,95 +485,60 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         elif self.Ncells_valid()==0:
             return self.locate_1d(t,c)
 
-
-        while True:
-            if c==self.INF_CELL:
-                #       // c must contain t in its interior
-                #       lt = OUTSIDE_CONVEX_HULL;
-                #       li = c->index(infinite_vertex());
-                # Changed to give adjacent edge, rather than 
-                # confusing loc_index=4
-                #  loc=(self.INF_CELL,self.OUTSIDE_CONVEX_HULL,last_edge)
-                # changed again, to give a half-edge
-                # flip the order because they were in the order with respect
-                # to the prev face, but now we jumped over last_edge
-                he=self.nodes_to_halfedge( last_nodes[1],last_nodes[0] )
-                loc=(self.INF_CELL,self.OUTSIDE_CONVEX_HULL,he)
-                return loc
-
-            p0=self.nodes['x'][self.cells['nodes'][c,0]]
-            p1=self.nodes['x'][self.cells['nodes'][c,1]]
-            p2=self.nodes['x'][self.cells['nodes'][c,2]]
-
-            prev = c
-
-            # Orientation o0, o1, o2;
-
-            # nodes are stored in CCW order for the cell.
-            # 1st edge connects first two nodes 
-            # neighboring cells follow the edges
-
-            o0 = robust_predicates.orientation(p0,p1,t)
-            if o0 == -1: # CW 
-                last_edge=self.cell_to_edges(c)[0]
-                last_nodes=self.cells['nodes'][c,[0,1]]
-                c=self.cell_to_cells(c)[0] 
-                continue
-
-            o1 = robust_predicates.orientation(p1,p2,t)
-            if o1 == -1:
-                last_edge=self.cell_to_edges(c)[1]
-                last_nodes=self.cells['nodes'][c,[1,2]]
-                c=self.cell_to_cells(c)[1] 
-                continue
-
-            o2 = robust_predicates.orientation(p2,p0,t)
-            if o2 == -1:
-                last_edge=self.cell_to_edges(c)[2] 
-                last_nodes=self.cells['nodes'][c,[2,0]]
-                c=self.cell_to_cells(c)[2] 
-                continue
-
-            # must be in or on a face --
-            break
-        # For simplicity, I'm skipping some optimizations which avoid re-checking
-        # the previous edge.  see Triangulation_2.h:2616
-
-        # now t is in c or on its boundary
-        o_sum=(o0==0)+(o1==0)+(o2==0)
-
-        if o_sum==0:
-            loc=(c,self.IN_FACE,4)
-        elif o_sum==1:
-            if o0==0:
-                j=0
-            elif o1==0:
-                j=1
-            else:
-                j=2
+        # plain python floats are much faster than numpy scalars for
+        # the orientation filter
+        t=np.asarray(t,np.float64).tolist()
+
+        fv=self.field_views()
+        c,o0,o1,o2,last_edge,last_nodes = locate_walk(c,t,
+                                                      fv.cells_nodes,
+                                                      fv.cells_edges,
+                                                      fv.edges_cells,
+                                                      fv.nodes_x)
+        if c<0:
+            #       // c must contain t in its interior
+            #       lt = OUTSIDE_CONVEX_HULL;
+            #       li = c->index(infinite_vertex());
+            # Changed to give adjacent edge, rather than 
+            # confusing loc_index=4
+            #  loc=(self.INF_CELL,self.OUTSIDE_CONVEX_HULL,last_edge)
+            # changed again, to give a half-edge
+            # flip the order because they were in the order with respect
+            # to the prev face, but now we jumped over last_edge
+            he=self.nodes_to_halfedge( last_nodes[1],last_nodes[0] )
+            return (self.INF_CELL,self.OUTSIDE_CONVEX_HULL,he)
+
+        # now t is in c or on its boundary.
+        # classify by which of the orientations are zero
+        key=(o0==0) | ((o1==0)<<1) | ((o2==0)<<2)
+        cls=self._locate_classify[key]
+        assert cls is not None
+        kind,idx=cls
+        if kind==self.IN_EDGE:
             # better to consistently return the edge index here, not
             # just its index in the cell
-            loc=(c,self.IN_EDGE,self.cells['edges'][c,j])
-        elif o_sum==2:
-            if o0!=0:
-                loc=(c,self.IN_VERTEX,2)
-            elif o1!=0:
-                loc=(c,self.IN_VERTEX,0)
-            else:
-                loc=(c,self.IN_VERTEX,1)
-        else:
-            assert False
-        return loc
+            idx=self.cells['edges'][c,idx]
+        return (c,kind,idx)
 
     def locate_1d(self,t,c):
         # There are some edges, and t may fall within an edge, off the end,
         # or off to the side.
         j=six.next(self.valid_edge_iter())
+
+        fv=self.field_views()
+        nodes_x=fv.nodes_x
+        edges_nodes=fv.edges_nodes
+        node_to_edges=self.node_to_edges
+        t=np.asarray(t,np.float64).tolist()
         
-        p0=self.nodes['x'][ self.edges['nodes'][j,0] ]
-        p1=self.nodes['x'][ self.edges['nodes'][j,1] ]
+        # plain python floats for the comparisons below
+        n0,n1=edges_nodes[j].tolist()
+        p0=nodes_x[n0].tolist()
+        p1=nodes_x[n1].tolist()
         
-        o=robust_predicates.orientation(p0,p1,t)
+        o=robust_predicates.orient2d_filter(p0[0],p0[1],
+                                            p1[0],p1[1],
+                                            t[0],t[1])
         if o!=0:
             return (self.INF_CELL,self.OUTSIDE_AFFINE_HULL,1)
 
@@ -344,11 +564,12 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
             # j indexes the edge we just tested. 
             # p0 and p1 are the endpoints of the edge
             # 1. do we want a neighbor of n0 or n1?
-            if direc*cmp(p0[coord],p1[coord]) < 0: # want to go towards p1
-                n_adj=self.edges['nodes'][j,1]
+            # sign of p0-p1 along coord. cmp() is gone in py3
+            if direc*((p0[coord]>p1[coord]) - (p0[coord]<p1[coord])) < 0: # want to go towards p1
+                n_adj=n1
             else:
-                n_adj=self.edges['nodes'][j,0]
-            for jnext in self.node_to_edges(n_adj):
+                n_adj=n0
+            for jnext in node_to_edges(n_adj):
                 if jnext!=j:
                     j=jnext
                     break
@@ -357,8 +578,9 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
                 # n_adj is the nearest to us
                 return (self.INF_CELL,self.OUTSIDE_CONVEX_HULL,n_adj)
 
-            p0=self.nodes['x'][ self.edges['nodes'][j,0] ]
-            p1=self.nodes['x'][ self.edges['nodes'][j,1] ]
+            n0,n1=edges_nodes[j].tolist()
+            p0=nodes_x[n0].tolist()
+            p1=nodes_x[n1].tolist()
 
             if (t[coord]<p0[coord]) != (t[coord]<p1[coord]):
                 return (self.INF_CELL,self.IN_EDGE,j)
@@ -388,14 +610,29 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
 
     def tri_insert_in_face(self,n,loc):
         loc_f,loc_type,_ = loc
-        a,b,c=self.cells['nodes'][loc_f]
-        self.delete_cell(loc_f)
-        self.add_edge(nodes=[n,a])
-        self.add_edge(nodes=[n,b])
-        self.add_edge(nodes=[n,c])
-        self.add_cell(nodes=[n,a,b])
-        self.add_cell(nodes=[n,b,c])
-        self.add_cell(nodes=[n,c,a])
+        self._split_face_into_three(loc_f,n)
+
+    def _split_face_into_three(self,c,n):
+        """ replace cell c with three cells joining its nodes to the
+        new node n, which must fall strictly inside c.  The topology is
+        all known, so the new edges and cells skip the existence and
+        orientation checks, and the first new cell reuses c's slot.
+        """
+        fv=self.field_views()
+        a,b,d=fv.cells_nodes[c].tolist()
+        j_ab,j_bd,j_da=fv.cells_edges[c].tolist()
+        self.delete_cell(c)
+        # n is new, so none of these can exist yet
+        j_na=self.add_edge(nodes=[n,a],_check_existing=False)
+        j_nb=self.add_edge(nodes=[n,b],_check_existing=False)
+        j_nd=self.add_edge(nodes=[n,d],_check_existing=False)
+        # cell edge k joins cell nodes k and k+1
+        self.add_cell(nodes=[n,a,b],edges=[j_na,j_ab,j_nb],_index=c,
+                      _force_invariants=False)
+        self.add_cell(nodes=[n,b,d],edges=[j_nb,j_bd,j_nd],
+                      _force_invariants=False)
+        self.add_cell(nodes=[n,d,a],edges=[j_nd,j_da,j_na],
+                      _force_invariants=False)
         
     def tri_insert_in_edge(self,n,loc):
         """ Takes care splitting the edge and any adjacent cells
@@ -404,27 +641,31 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
 
         self.log.debug("Loc puts new vertex in edge %s"%loc_edge)
         cells_to_split=[]
-        for c in self.edge_to_cells(loc_edge):
+        # edges['cells'] is always current in a Triangulation, so skip
+        # the edge_to_cells() bookkeeping
+        for c in self.edges['cells'][loc_edge].tolist():
             if c<0: continue
-            cells_to_split.append(  self.cells[c].copy() )
+            # only the nodes are needed below
+            cells_to_split.append( self.cells['nodes'][c].tolist() )
             self.log.debug("Deleting cell on insert %d"%c)
             self.delete_cell(c)
 
         # Modify the edge:
-        a,c=self.edges['nodes'][loc_edge]
+        a,c=self.edges['nodes'][loc_edge].tolist()
         b=n
         self.delete_edge(loc_edge)
         
-        self.add_edge(nodes=[a,b])
-        self.add_edge(nodes=[b,c])
+        # b is new, so none of its edges can exist yet
+        self.add_edge(nodes=[a,b],_check_existing=False)
+        self.add_edge(nodes=[b,c],_check_existing=False)
         
-        for cell_data in cells_to_split:
-            common=[n for n in cell_data['nodes']
+        for cell_nodes in cells_to_split:
+            common=[n for n in cell_nodes
                     if n!=a and n!=c][0]
-            jnew=self.add_edge(nodes=[b,common])
+            jnew=self.add_edge(nodes=[b,common],_check_existing=False)
             
             for replace in [a,c]:
-                nodes=list(cell_data['nodes'])
+                nodes=list(cell_nodes)
                 idx=nodes.index(replace)
                 nodes[idx]=b
                 self.add_cell(nodes=nodes)
@@ -459,8 +700,8 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
 
         def check_halfedge(he):
             nodes=[he.node_rev(),he.node_fwd(),n]
-            pnts=self.nodes['x'][nodes]
-            ccw=robust_predicates.orientation(pnts[0],pnts[1],pnts[2])
+            (ax,ay),(bx,by),(cx,cy)=self.nodes['x'][nodes].tolist()
+            ccw=robust_predicates.orient2d_filter(ax,ay,bx,by,cx,cy)
             return ccw>0
         assert check_halfedge(he0)
 
@@ -535,9 +776,9 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
             # a general unstructured_grid base class.  The base class makes
             # an incompatible assumption, that the first edge connects the first
             # two nodes.  
-            pnts=self.nodes['x'][nodes]
+            (ax,ay),(bx,by),(cx,cy)=self.nodes['x'][nodes].tolist()
 
-            ccw=robust_predicates.orientation(pnts[0],pnts[1],pnts[2]) 
+            ccw=robust_predicates.orient2d_filter(ax,ay,bx,by,cx,cy)
             assert ccw!=0
             if ccw<0:
                 nodes=nodes[::-1]
@@ -570,28 +811,33 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         to implemenet. There *does* have to be a potential cell on either
         side).
         """
-        c_left,c_right=self.edges['cells'][j,:]
+        fv=self.field_views()
+        c_left,c_right=fv.edges_cells[j].tolist()
+        na,nc = fv.edges_nodes[j].tolist()
         self.log.debug("Flipping edge %d, with cells %d, %d   nodes %d,%d"%(j,c_left,c_right,
-                                                                            self.edges['nodes'][j,0],
-                                                                            self.edges['nodes'][j,1]) )
+                                                                            na,nc) )
         assert c_left>=0 # could be relaxed, at the cost of some complexity here
         assert c_right>=0
         # could work harder to preserve extra info:
         #c_left_data = self.cells[c_left].copy()
         #c_right_data = self.cells[c_right].copy()
 
-
-        # This is dangerous! - deleting the cells means that topo_sort is no good,
-        # and that breaks half-edge ops.
-        # moving to happen a bit later -
-        # self.delete_cell(c_left)
-        # self.delete_cell(c_right)
-        he_left=unstructured_grid.HalfEdge(self,j,0)
-        he_right=unstructured_grid.HalfEdge(self,j,1)
-
-        na,nc = self.edges['nodes'][j]
-        nd=he_left.fwd().node_fwd()
-        nb=he_right.fwd().node_fwd()
+        # Read the quad straight from the two cells.  Cell edge k joins
+        # cell nodes k and k+1.  c_left is (na,nc,nd), c_right is (nc,na,nb),
+        # up to rotation.
+        l_nodes=fv.cells_nodes[c_left].tolist()
+        l_edges=fv.cells_edges[c_left].tolist()
+        k=l_nodes.index(na)
+        nd=l_nodes[(k+2)%3]
+        j_cd=l_edges[(k+1)%3]
+        j_da=l_edges[(k+2)%3]
+
+        r_nodes=fv.cells_nodes[c_right].tolist()
+        r_edges=fv.cells_edges[c_right].tolist()
+        k=r_nodes.index(nc)
+        nb=r_nodes[(k+2)%3]
+        j_ab=r_edges[(k+1)%3]
+        j_bc=r_edges[(k+2)%3]
 
         # DBG
         if 0:
@@ -605,9 +851,16 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         self.delete_cell(c_right)
                 
         self.modify_edge(j,nodes=[nb,nd])
-        new_left =self.add_cell(nodes=[na,nb,nd])
-        new_right=self.add_cell(nodes=[nc,nd,nb])
-        return new_left,new_right
+        # reuse the slots, lowest first since deleting a trailing
+        # cell truncates the array
+        new_cells=[ (c_left, [na,nb,nd], [j_ab,j,j_da]),
+                    (c_right,[nc,nd,nb], [j_cd,j,j_bc]) ]
+        if c_right<c_left:
+            new_cells=new_cells[::-1]
+        for c,nodes,edges in new_cells:
+            self.add_cell(nodes=nodes,edges=edges,_index=c,
+                          _force_invariants=False)
+        return c_left,c_right
 
     def delete_node(self,n):
         """ Triangulation version implies cascade, but also 
@@ -659,19 +912,17 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         #  1) any finite face is incident to v
         #  2) all vertices are collinear
         assert self.dim() == 2
-        for c in self.valid_cell_iter():
-            if n not in self.cell_to_nodes(c):
-                # There is a triangle not involving n
-                # deleting n would retain a 2D triangulation
-                return False
-        pnts=[self.nodes['x'][i]
-              for i in self.valid_node_iter()
-              if i!=n]
-        a,b = pnts[:2]
-        for c in pnts[2:]:
-            if robust_predicates.orientation(a,b,c) != 0:
-                return False
-        return True
+        # node_to_cells only tracks valid cells.  If any cell does not
+        # involve n, deleting n would retain a 2D triangulation
+        if len(self.node_to_cells(n)) < self.Ncells_valid():
+            return False
+
+        # all cells touch n - check collinearity of the others in one
+        # vectorized pass. only near-collinear points need exact tests.
+        others=np.nonzero(~self.nodes['deleted'])[0]
+        pnts=self.nodes['x'][others[others!=n]]
+        o=robust_predicates.orientation_array(pnts[0],pnts[1],pnts[2:])
+        return not np.any(o)
         
     def delete_node_2d(self,n):
         if self.test_delete_node_dim_down(n):
@@ -689,15 +940,24 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
 
         # new way
         nbrs=self.angle_sort_adjacent_nodes(deletee)
-        edges_to_delete=[]
 
+        # for each spoke deletee=>nbr, its edge and the cell to its left,
+        # which is (deletee,nbrA,nbrB) when that triangle exists.
+        fv=self.field_views()
+        hes=self._incident_halfedges(deletee)
+        js=hes//2
+        orients=hes%2
+        spoke_nbrs=fv.edges_nodes[js,1-orients].tolist()
+        spoke_edge=dict(zip(spoke_nbrs,js.tolist()))
+        spoke_cell=dict(zip(spoke_nbrs,fv.edges_cells[js,orients].tolist()))
+
+        edges_to_delete=[]
         hole_nodes=[]
-        for nbrA,nbrB in circular_pairs(nbrs):
+        for nbrA in nbrs:
             hole_nodes.append(nbrA)
-            he=self.nodes_to_halfedge(nbrA,nbrB)
-            if (he is None) or (he.cell()<0) or (n not in self.cell_to_nodes(he.cell())):
+            if spoke_cell[nbrA]<0:
                 hole_nodes.append('inf')
-            edges_to_delete.append( self.nodes_to_edge( [deletee,nbrA] ) )
+            edges_to_delete.append( spoke_edge[nbrA] )
 
         for j in edges_to_delete:
             self.delete_edge_cascade(j)
@@ -707,20 +967,29 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         # it's not terribly slow, and can be done with the existing
         # helpers.
         self.fill_hole(hole_nodes)
+    # holes with more candidates than this test them in a vectorized batch
+    fill_hole_vector_min=10
     def fill_hole(self,hole_nodes):
         
-        # track potentially multiple holes
-        # a few place use list-specific semantics - not ndarray
-        hole_nodes=list(hole_nodes)
-        holes_nodes=[ hole_nodes ]
-
-        while len(holes_nodes):
-            hole_nodes=holes_nodes.pop()
-
-            while 'inf' in hole_nodes[:2]:
-                hole_nodes = hole_nodes[1:] + hole_nodes[:1]
-                
-            a,b=hole_nodes[:2]
+        # track potentially multiple holes.
+        # The holes are circular linked lists sharing two parallel lists:
+        # hole_val[i] is a node (or 'inf') and hole_next[i] the slot
+        # following slot i.  A pending hole is (first slot,length), so
+        # trimming or splitting a hole only relinks a couple of slots.
+        hole_val=list(hole_nodes)
+        hole_next=list(range(1,len(hole_val))) + [0]
+        holes=[ (0,len(hole_val)) ]
+        # only cells and edges are added below, so this view stays valid
+        nx=self.field_views().nodes_x
+
+        while len(holes):
+            s_a,length=holes.pop()
+
+            while 'inf' in (hole_val[s_a],hole_val[hole_next[s_a]]):
+                s_a=hole_next[s_a]
+            s_b=hole_next[s_a]
+            a=hole_val[s_a]
+            b=hole_val[s_b]
 
             self.log.debug("Considering edge %d-%d"%(a,b) )
 
@@ -730,42 +999,64 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
             # so drop it from candidates here, but remember that we saw it
 
             # first, sweep through the candidates to test CCW
+            # c_cand2 holds (position in hole, slot, node)
             has_inf=False
-            c_cand1=hole_nodes[2:]
             c_cand2=[]
-            for c in c_cand1:
+            ax,ay=nx[a].tolist()
+            bx,by=nx[b].tolist()
+            slot=hole_next[s_b]
+            for pos in range(2,length):
+                c=hole_val[slot]
                 if c=='inf':
+                    if not has_inf:
+                        inf_cand=(pos,slot,c)
                     has_inf=True
-                elif robust_predicates.orientation( self.nodes['x'][a],
-                                                    self.nodes['x'][b],
-                                                    self.nodes['x'][c] ) > 0:
-                    c_cand2.append(c)
-
-            self.log.debug("After CCW tests, %s are left"%c_cand2)
+                else:
+                    cx,cy=nx[c].tolist()
+                    if robust_predicates.orient2d_filter(ax,ay,bx,by,cx,cy) > 0:
+                        c_cand2.append( (pos,slot,c) )
+                slot=hole_next[slot]
+
+            self.log.debug("After CCW tests, %s are left"%[cc for _,_,cc in c_cand2])
+
+            if len(c_cand2)>self.fill_hole_vector_min:
+                # large hole: test each c against all remaining candidates
+                # at once.  incircle_array only does the exact test where
+                # the floating point result is in doubt.
+                cand_x=nx[ [cc for _,_,cc in c_cand2] ]
+                while len(c_cand2)>1:
+                    inside=robust_predicates.incircle_array([ax,ay],[bx,by],
+                                                            cand_x[0],cand_x[1:])>0
+                    if not np.any(inside):
+                        c_cand2=c_cand2[:1]
+                        break
+                    self.log.debug("%d was inside %d-%d-%d"%(c_cand2[1+np.nonzero(inside)[0][0]][2],
+                                                             a,b,c_cand2[0][2]))
+                    c_cand2.pop(0)
+                    cand_x=cand_x[1:]
 
             while len(c_cand2)>1:
-                c=c_cand2[0]
-                for d in c_cand2[1:]:
-                    tst=robust_predicates.incircle( self.nodes['x'][a],
-                                                    self.nodes['x'][b],
-                                                    self.nodes['x'][c],
-                                                    self.nodes['x'][d] )
+                c=c_cand2[0][2]
+                cx,cy=nx[c].tolist()
+                for _,_,d in c_cand2[1:]:
+                    dx,dy=nx[d].tolist()
+                    tst=robust_predicates.incircle_filter(ax,ay,bx,by,
+                                                          cx,cy,dx,dy)
                     if tst>0:
                         self.log.debug("%d was inside %d-%d-%d"%(d,a,b,c))
                         c_cand2.pop(0)
                         break
                 else:
                     # c passed all the tests
-                    c_cand2=[c]
+                    c_cand2=c_cand2[:1]
                     break
             # if the hole nodes are already all convex, then they already
             # form the new convex hull - n was on the hull and simply goes
             # away
             if has_inf and not c_cand2:
-                c_cand2=['inf']
-                c='inf' # was this missing??
+                pos,s_c,c=inf_cand
             else:
-                c=c_cand2[0]
+                pos,s_c,c=c_cand2[0]
 
             self.log.debug("Decided on %s-%s-%s"%(a,b,c))
 
@@ -775,89 +1066,100 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
                 self.add_cell_and_edges( nodes=[a,b,c] )
 
             # what hole to put back on the queue?
-            if len(hole_nodes)==3:
+            if length==3:
                 # finished this hole.
                 self.log.debug("Hole is finished")
                 continue
-            elif c==hole_nodes[2]:
+            elif pos==2:
                 self.log.debug("Hole is trimmed from front")
-                hole_nodes[:3] = [a,c]
-                holes_nodes.append( hole_nodes )
-            elif c==hole_nodes[-1]:
+                # drop b: a,c,...
+                hole_next[s_a]=s_c
+                holes.append( (s_a,length-1) )
+            elif pos==length-1:
                 self.log.debug("Hole is trimmed from back")
-                hole_nodes=hole_nodes[1:] # drop a
-                self.log.debug("  New hole is %s"%hole_nodes)
-                holes_nodes.append( hole_nodes )
+                # drop a: b,...,c
+                hole_next[s_c]=s_b
+                holes.append( (s_b,length-1) )
             else:
                 self.log.debug("Created two new holes")
-                idx=hole_nodes.index(c)
-
-                h1=hole_nodes[1:idx+1]
-                h2=hole_nodes[idx:] + hole_nodes[:1]
-                self.log.debug("  New hole: %s"%h1)
-                self.log.debug("  New hole: %s"%h2)
-
-                holes_nodes.append( h1 )
-                holes_nodes.append( h2 )
+                # b,...,c and c,...,a - c goes in both, so it gets a
+                # second slot for the latter.
+                s_c2=len(hole_val)
+                hole_val.append(c)
+                hole_next.append(hole_next[s_c])
+                hole_next[s_c]=s_b
+                hole_next[s_a]=s_c2
 
+                holes.append( (s_b,pos) )
+                holes.append( (s_c2,length-pos+1) )
 
     # Make a check for the delaunay criterion:
     def check_global_delaunay(self):
         bad_checks=[] # [ (cell,node),...]
-        for c in self.valid_cell_iter():
-            nodes=self.cells['nodes'][c]
-            pnts=self.nodes['x'][nodes]
-
-            # brute force - check them all.
-            for n in self.valid_node_iter():
-                if n in nodes:
-                    continue
-                t=self.nodes['x'][n]
-                check=robust_predicates.incircle(pnts[0],pnts[1],pnts[2],t)
-                if check>0:
-                    # how do we check for constraints here?
-                    # maybe more edge-centric?
-                    # tests of a cell on one side of an edge against a node on the
-                    # other is reflexive.
-                    # 
-                    
-                    # could go through the edges of c, 
-                    msg="Node %d is inside the circumcircle of cell %d (%d,%d,%d)"%(n,c,
-                                                                                    nodes[0],nodes[1],nodes[2])
-                    self.log.error(msg)
-                    bad_checks.append( (c,n) )
+        fv=self.field_views()
+        cells=np.nonzero(~self.cells['deleted'])[0]
+        nodes=np.nonzero(~self.nodes['deleted'])[0]
+        cell_nodes=fv.cells_nodes[cells]
+        cell_pnts=fv.nodes_x[cell_nodes] # [Ncells,3,2]
+        node_pnts=fv.nodes_x[nodes][None,:,:]
+
+        # brute force - check them all, in blocks of cells to limit the
+        # size of the temporaries
+        blk=max(1,100000//max(1,len(nodes)))
+        for start in range(0,len(cells),blk):
+            pnts=cell_pnts[start:start+blk,:,None,:]
+            check=robust_predicates.incircle_array(pnts[:,0],pnts[:,1],pnts[:,2],
+                                                   node_pnts)
+            # a cell's own nodes give exactly 0
+            for ci,ni in zip(*np.nonzero(check>0)):
+                c=cells[start+ci]
+                n=nodes[ni]
+                # how do we check for constraints here?
+                # maybe more edge-centric?
+                # tests of a cell on one side of an edge against a node on the
+                # other is reflexive.
+                # 
+
+                # could go through the edges of c, 
+                cn=cell_nodes[start+ci]
+                msg="Node %d is inside the circumcircle of cell %d (%d,%d,%d)"%(n,c,
+                                                                                cn[0],cn[1],cn[2])
+                self.log.error(msg)
+                bad_checks.append( (c,n) )
         return bad_checks
     
     def check_local_delaunay(self):
         """ Check both sides of each edge - can deal with constrained edges.
         """
         bad_checks=[] # [ (cell,node),...]
-        for j in self.valid_edge_iter():
-            if self.edges['constrained'][j]:
-                continue
-            c1,c2 = self.edge_to_cells(j)
-            if c1<0 or c2<0:
-                continue
-            # always check the smaller index -
-            # might help with caching later on.
-            c=min(c1,c2)
-            c_opp=max(c1,c2)
-            
-            nodes=self.cells['nodes'][c]
-            pnts=self.nodes['x'][nodes]
-
-            # brute force - check them all.
-            for n in self.cell_to_nodes(c_opp):
-                if n in nodes:
-                    continue
-                t=self.nodes['x'][n]
-                check=robust_predicates.incircle(pnts[0],pnts[1],pnts[2],t)
-                if check>0:
-                    msg="Node %d is inside the circumcircle of cell %d (%d,%d,%d)"%(n,c,
-                                                                                    nodes[0],nodes[1],nodes[2])
-                    self.log.error(msg)
-                    bad_checks.append( (c,n) )
-                    raise Exception('fail')
+        fv=self.field_views()
+        # interior, unconstrained edges, in one pass over the edge fields.
+        # hull edges have a negative cell on one side
+        e2c=fv.edges_cells
+        js=np.nonzero( (~self.edges['deleted']) & (~fv.edges_constrained)
+                       & (e2c[:,0]>=0) & (e2c[:,1]>=0) )[0]
+        e2c=e2c[js]
+        # always check the smaller index -
+        # might help with caching later on.
+        cs=e2c.min(axis=1)
+        c_opps=e2c.max(axis=1)
+
+        cell_nodes=fv.cells_nodes[cs]
+        opp_nodes=fv.cells_nodes[c_opps]
+        # the node of c_opp which is not in c
+        not_shared=np.all( opp_nodes[:,:,None]!=cell_nodes[:,None,:], axis=2)
+        ns=opp_nodes[not_shared]
+
+        pnts=fv.nodes_x[cell_nodes]
+        check=robust_predicates.incircle_array(pnts[:,0],pnts[:,1],pnts[:,2],
+                                               fv.nodes_x[ns])
+        for i in np.nonzero(check>0)[0]:
+            n=ns[i] ; c=cs[i] ; nodes=cell_nodes[i]
+            msg="Node %d is inside the circumcircle of cell %d (%d,%d,%d)"%(n,c,
+                                                                            nodes[0],nodes[1],nodes[2])
+            self.log.error(msg)
+            bad_checks.append( (c,n) )
+            raise Exception('fail')
         return bad_checks
     
     def restore_delaunay(self,n):
@@ -884,31 +1186,42 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         #   f=next;
         # } while(next != start);
 
-        # Shaky on the details, but for starters, try marking the CCW sweep
-        # based on neighbor nodes.
-        nbr_nodes=self.angle_sort_adjacent_nodes(n)
-        
-        start=trav=nbr_nodes[0]
-        trav_next=nbr_nodes[1]
+        # Same sweep, walking the cells around n via cells['edges'].  Flips
+        # only touch edges opposite n and stay within the wedge of the cell
+        # being processed, so the next cell can be lined up before
+        # propagating_flip, and the spokes are stable.
+        cells=self.node_to_cells(n)
+        if len(cells)==0:
+            return
+
+        fv=self.field_views()
+        def other_cell(j,c):
+            c1,c2=fv.edges_cells[j].tolist()
+            return c2 if c1==c else c1
 
+        # back up CW to a hull cell, or all the way around for an
+        # interior node.
+        start=c=cells[0]
         while 1:
-            c=self.nodes_to_cell( [n,trav,trav_next],fail_hard=False)
-            if c is not None:    
-                for i in [0,1,2]:
-                    if self.cells['nodes'][c,i]==n:
-                        break
-                else:
-                    assert False
+            i=fv.cells_nodes[c].tolist().index(n)
+            c_prev=other_cell(fv.cells_edges[c,i],c)
+            if c_prev<0 or c_prev==start:
+                break
+            c=c_prev
+        j_stop=fv.cells_edges[c,i]
+
+        while 1:
+            i=fv.cells_nodes[c].tolist().index(n)
             # line up the next cell before modifying this one
-            nbr_nodes=self.angle_sort_adjacent_nodes(n,ref_nbr=trav_next)
-            trav=trav_next
-            trav_next=nbr_nodes[1]
+            j_next=fv.cells_edges[c,(i+2)%3]
+            c_next=other_cell(j_next,c)
 
-            if c is not None:
-                self.propagating_flip(c,i)
-                
-            if trav == start:
+            self.propagating_flip(c,i)
+            fv=self.field_views()
+
+            if c_next<0 or j_next==j_stop:
                 break
+            c=c_next
 
         if self.post_check:
             bad=self.check_local_delaunay()
@@ -923,45 +1236,77 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         # track the stack based on the halfedge one place CW
         # from the edge to be flipped.
 
+        # flips reuse cell slots, but a trailing slot can be truncated and
+        # re-appended, so these are refreshed after each flip.
+        fv=self.field_views()
+        nx=fv.nodes_x ; cn=fv.cells_nodes ; ce=fv.cells_edges
+        en=fv.edges_nodes ; ecells=fv.edges_cells ; ec=fv.edges_constrained
+        incircle=robust_predicates.incircle_filter
+
+        # halfedges on the stack are encoded as (j<<1)|orient
+        def cell_step(he,step):
+            # the halfedge following (step=1) or preceding (step=2) he
+            # within the cell it faces.
+            j=he>>1 ; o=he&1
+            c=ecells[j,o]
+            if c<0: # no cell - fall back to the geometric traversal
+                h=unstructured_grid.HalfEdge(self,j,o)
+                h=h.fwd() if step==1 else h.rev()
+                return (int(h.j)<<1) | int(h.orient)
+            k=cn[c].tolist().index(en[j,o])
+            j2=int(ce[c,(k+step)%3])
+            return (j2<<1) | int(ecells[j2,0]!=c)
+
         edges=[] # std::stack<Edge> edges;
-        vp = self.cells['nodes'][c,i]  #  const Vertex_handle& vp = f->vertex(i);
-        p=self.nodes['x'][vp] # const Point& p = vp->point();
+        vp = int(cn[c,i])  #  const Vertex_handle& vp = f->vertex(i);
+        px,py=nx[vp].tolist() # const Point& p = vp->point();
 
         # maybe better to use half-edges here.
         # ordering of edges is slightly different than CGAL.
         # if i gives the vertex, 
         # edges.push(Edge(f,i)); # this is the edge *opposite* vp
         # for our ordering, need edge i+1
-        edges.append( self.cell_to_halfedge(c,i) )
+        he=self.cell_to_halfedge(c,i)
+        edges.append( (int(he.j)<<1) | he.orient )
 
         while edges: # (! edges.empty()){
             #const Edge& e = edges.top()
             he=edges[-1]
 
-            he_flip=he.fwd()
+            he_flip=cell_step(he,1)
+            j_flip=he_flip>>1
             # not sure about this part:
-            if self.edges['constrained'][he_flip.j]:
+            if ec[j_flip]:
                 edges.pop()
                 continue
             
-            nbr=he_flip.cell_opp()
+            nbr=ecells[j_flip,1-(he_flip&1)]
 
             if nbr>=0:
+                n0,n1,n2 = cn[nbr].tolist()
+                # he_flip is opposite vp, so a valid neighbor never has vp
+                # as a vertex.  If it did, incircle would be exactly 0 and
+                # there is nothing to flip.
+                if vp==n0 or vp==n1 or vp==n2:
+                    edges.pop()
+                    continue
                 # assuming that ON_POSITIVE_SIDE would mean that p (the location of the
                 # originating vertex) is *inside* the CCW-defined circle of the neighbor
                 # and would thus mean that the delaunay criterion is not satisfied.
                 #if ON_POSITIVE_SIDE != side_of_oriented_circle(n,  p, true):
-                nbr_points= self.nodes['x'][ self.cells['nodes'][nbr] ]
+                ax,ay=nx[n0].tolist()
+                bx,by=nx[n1].tolist()
+                cx,cy=nx[n2].tolist()
 
-                p_in_nbr = robust_predicates.incircle(nbr_points[0],
-                                                      nbr_points[1],
-                                                      nbr_points[2],
-                                                      p )
+                p_in_nbr = incircle(ax,ay,bx,by,cx,cy,px,py)
                 #if side_of_oriented_circle(n,  p, true) == ON_POSITIVE_SIDE:
                 if p_in_nbr > 0: 
-                    self.flip_edge(he_flip.j)
-                    extra=he.rev().opposite()
-                    edges.append(extra)
+                    self.flip_edge(j_flip)
+                    fv=self.field_views()
+                    nx=fv.nodes_x ; cn=fv.cells_nodes ; ce=fv.cells_edges
+                    en=fv.edges_nodes ; ecells=fv.edges_cells ; ec=fv.edges_constrained
+                    # he.rev().opposite()
+                    edges.append( cell_step(he,2) ^ 1 )
                     continue
             edges.pop() # drops last item
             continue
@@ -981,116 +1326,120 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         assert not self.nodes['deleted'][nA]
         assert not self.nodes['deleted'][nB]
 
-        def ordered(x1,x2,x3):
-            # given collinear points, return true if they are in order
-            # along that line
-            if x1[0]!=x2[0]:
-                i=0
-            else:
-                i=1
-            return (x1[i]<x2[i]) == (x2[i]<x3[i])
-        
-        # traversal could encounter multiple types of elements
-        trav=('node',nA)
-        A=self.nodes['x'][nA]
-        B=self.nodes['x'][nB]
+        # node coordinates are read through the field view, rather than
+        # a new self.nodes['x'] view for each lookup
+        fv=self.field_views()
+        nx=fv.nodes_x
+
+        # traversal could encounter multiple types of elements.
+        # the current element is the node ntrav, or when ntrav is -1,
+        # the half edge he_trav which was just crossed.  history gets
+        # the tagged tuples.
+        ntrav=nA
+        he_trav=None
+        ax,ay=nx[nA].tolist()
+        bx,by=nx[nB].tolist()
+        orient=robust_predicates.orient2d_filter
 
-        history=[trav]
+        history=[('node',nA)]
 
         if self.dim()==1:
-            assert trav[0]=='node'
-            n_nbrs=self.node_to_nodes(trav[1])
+            n_nbrs=self.node_to_nodes(nA)
             for n_nbr in n_nbrs:
                 if n_nbr==nB:
                     history.append( ('node',nB) )
                     return history
-                if ordered( self.nodes['x'][nA],
-                            self.nodes['x'][n_nbr],
-                            self.nodes['x'][nB] ):
-                    trav=('node',n_nbr)
-                    history.append( trav )
+                cx,cy=nx[n_nbr].tolist()
+                if ordered(ax,ay,cx,cy,bx,by):
+                    ntrav=n_nbr
+                    history.append( ('node',ntrav) )
                     he=self.nodes_to_halfedge(nA,n_nbr)
                     break
             else:
                 assert False # should never get here
             
-            while trav!=('node',nB):
+            while ntrav!=nB:
                 he=he.fwd()
-                trav=('node',he.node_fwd())
-                history.append(trav)
+                ntrav=he.node_fwd()
+                history.append( ('node',ntrav) )
             return history
         else:
-            while trav!=('node',nB):
-                if trav[0]=='node':
-                    ntrav=trav[1]
+            while ntrav!=nB:
+                if ntrav>=0:
                     for c in self.node_to_cells(ntrav):
-                        cn=self.cell_to_nodes(c)
-                        # print "At node %d, checking cell %d (%s)"%(ntrav,c,cn)
-                        ci_trav=list(cn).index(ntrav) # index of ntrav in cell c
-                        nD=cn[(ci_trav+1)%3]
-                        nE=cn[(ci_trav+2)%3]
+                        n0,n1,n2=fv.cells_nodes[c].tolist()
+                        # print "At node %d, checking cell %d (%s)"%(ntrav,c,(n0,n1,n2))
+                        # index of ntrav in cell c, and the next two nodes
+                        if n0==ntrav:
+                            ci_trav,nD,nE=0,n1,n2
+                        elif n1==ntrav:
+                            ci_trav,nD,nE=1,n2,n0
+                        else:
+                            ci_trav,nD,nE=2,n0,n1
                         if nD==nB or nE==nB:
-                            trav=('node',nB)
+                            ntrav=nB
                             # print "Done"
                             break
 
-                        D=self.nodes['x'][nD]
-                        oD=robust_predicates.orientation( A,B,D )
+                        dx,dy=nx[nD].tolist()
+                        oD=orient(ax,ay,bx,by,dx,dy)
                         if oD>0:
                             continue
-                        N=self.nodes['x'][ntrav]
-                        if oD==0 and ordered(N,D,B):
+                        tx,ty=nx[ntrav].tolist()
+                        if oD==0 and ordered(tx,ty,dx,dy,bx,by):
                             # fell exactly on the A-B segment, and is in the
                             # right direction
-                            trav=('node',nD)
+                            ntrav=nD
                             break
 
-                        E=self.nodes['x'][nE]
-                        oE=robust_predicates.orientation( A,B,E )
+                        ex,ey=nx[nE].tolist()
+                        oE=orient(ax,ay,bx,by,ex,ey)
                         if oE<0:
                             continue
-                        if oE==0 and ordered(N,E,B):
+                        if oE==0 and ordered(tx,ty,ex,ey,bx,by):
                             # direction
-                            trav=('node',nE)
+                            ntrav=nE
                             break
-                        j=self.cell_to_edges(c)[ (ci_trav+1)%3 ]
-                        j_nbrs=self.edge_to_cells(j)
+                        j=fv.cells_edges[c,(ci_trav+1)%3]
+                        j_nbrs=fv.edges_cells[j]
                         # AB crosses an edge - record the edge, and the side we are
                         # approaching from:
                         history.append( ('cell',c) )
                         if j_nbrs[0]==c:
-                            trav=('edge',self.halfedge(j,0))
-                            # making sure I got the 0/1 correct
-                            assert trav[1].cell()==c
-                            break
+                            he_trav=self.halfedge(j,0)
                         elif j_nbrs[1]==c:
-                            trav=('edge',self.halfedge(j,1))
-                            # ditto
-                            assert trav[1].cell()==c
-                            break
-                        assert False
-                elif trav[0]=='edge':
-                    he=trav[1].opposite()
+                            he_trav=self.halfedge(j,1)
+                        else:
+                            assert False
+                        # making sure I got the 0/1 correct
+                        assert he_trav.cell()==c
+                        ntrav=-1
+                        break
+                else:
+                    he=he_trav.opposite()
                     #jnodes=self.edges['nodes'][j]
                     # have to choose between the opposite two edges or their common
                     # node:
                     c_next=he.cell()
                     history.append( ('cell',c_next) )
 
-                    nD=he.fwd().node_fwd()
+                    he_fwd=self.halfedge_nbr(he,0)
+                    nD=he_fwd.node_fwd()
                     # print "Entering cell %d with nodes %s"%(c_next,self.cell_to_nodes(c_next))
 
-                    oD=robust_predicates.orientation( A,B, self.nodes['x'][nD] )
+                    dx,dy=nx[nD].tolist()
+                    oD=orient(ax,ay,bx,by,dx,dy)
                     if oD==0:
-                        trav=('node',nD)
+                        ntrav=nD
                     elif oD>0:
                         # going to cross
-                        trav=('edge',he.fwd())
+                        he_trav=he_fwd
                     else:
-                        trav=('edge',he.rev())
+                        he_trav=self.halfedge_nbr(he,1)
+                if ntrav>=0:
+                    history.append( ('node',ntrav) )
                 else:
-                    assert False
-                history.append(trav)
+                    history.append( ('edge',he_trav) )
         return history
 
     def add_constraint(self,nA,nB):
@@ -1146,12 +1495,20 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         self.fill_hole( left_nodes )
         self.fill_hole( right_nodes )
 
+    def add_constraints(self,segs):
+        """ add_constraint() for each row of segs, an [M,2] array of node
+        pairs, in order.  Stops at the first constraint which fails, with
+        the earlier ones left in place.
+        """
+        for nA,nB in np.asarray(segs).tolist():
+            self.add_constraint(nA,nB)
+
     def remove_constraint(self,nA,nB):
         j=self.nodes_to_edge([nA,nB])
         assert self.edges['constrained'][j]
         self.edges['constrained'][j]=False
 
-        c1,c2=self.edge_to_cells(j)
+        c1,c2=self.edges['cells'][j].tolist()
         if (c1>=0) and (c2>=0):
             c=c1 # can we just propagate from one side?
             for ni,n in enumerate(self.cell_to_nodes(c1)):
@@ -1171,42 +1528,48 @@ class Triangulation(unstructured_grid.UnstructuredGrid):
         sdt = spatial.Delaunay(points)
 
         self.nodes=np.zeros( len(points), self.node_dtype)
-        self.cells=np.zeros( sdt.vertices.shape[0], self.cell_dtype)
+        self.cells=np.zeros( sdt.simplices.shape[0], self.cell_dtype)
 
         self.nodes['x']=points
-        self.cells['nodes']=sdt.vertices
+        self.cells['nodes']=sdt.simplices
 
         # looks like it's CGAL style:
         # neighbor[1] shares nodes[0] and nodes[2]
         # vertices are CCW
 
-        for c in range(self.Ncells()):
-            for i,(a,b) in enumerate(circular_pairs(self.cells['nodes'][c])):
-                # first time - that would be i=0, and the first two nodes.
-                # but for neighbors, it's indexed by the opposite node.  so the edge
-                # connected the nodes[0]--nodes[1] corresponds with neighbor 2.
-                c_nbr=sdt.neighbors[c,(i+2)%3]
-
-                # c_nbr==-1 on convex hull.
-                # only worry about cases where c is larger.
-                if c<c_nbr:
-                    continue
-
-                if c_nbr<0:
-                    c_nbr=self.INF_CELL
-
-                j=self.add_edge(nodes=[a,b],
-                                cells=[c,c_nbr])
-                # and record in the cell, too
-                self.cells['edges'][c,i]=j
-                if c_nbr!=self.INF_CELL:
-                    nbr_nodes=self.cells['nodes'][c_nbr]
-                    for i_nbr in [0,1,2]:
-                        if nbr_nodes[i_nbr]==b and nbr_nodes[(i_nbr+1)%3]==a:
-                            self.cells['edges'][c_nbr,i_nbr]=j
-                            break
-                    else:
-                        assert False
+        # halfedge i of cell c runs nodes[c,i] to nodes[c,i+1], and is
+        # opposite the node (i+2)%3, so it is shared with neighbor (i+2)%3.
+        # neighbor==-1 on convex hull.
+        Nc=self.Ncells()
+        he_a=sdt.simplices.ravel()
+        he_b=sdt.simplices[:,[1,2,0]].ravel()
+        he_cell=np.repeat(np.arange(Nc),3)
+        he_nbr=sdt.neighbors[:,[2,0,1]].ravel()
+
+        # each edge is created by the halfedge of the larger-numbered cell,
+        # in cell order.
+        owner=he_cell>he_nbr
+        Nj=owner.sum()
+        self.edges=np.zeros( Nj, self.edge_dtype)
+        self.edges['nodes'][:,0]=he_a[owner]
+        self.edges['nodes'][:,1]=he_b[owner]
+        self.edges['cells'][:,0]=he_cell[owner]
+        c_nbr=he_nbr[owner]
+        c_nbr[c_nbr<0]=self.INF_CELL
+        self.edges['cells'][:,1]=c_nbr
+
+        # and record in the cells, too
+        cell_edges=np.zeros(3*Nc,np.int32)
+        cell_edges[owner]=np.arange(Nj)
+        # the other halfedges take the edge of their twin in the neighbor,
+        # which starts from he_b.
+        other=np.nonzero(~owner)[0]
+        nbr=he_nbr[other]
+        i_nbr=np.argmax( self.cells['nodes'][nbr]==he_b[other][:,None], axis=1)
+        cell_edges[other]=cell_edges[3*nbr+i_nbr]
+        self.cells['edges']=cell_edges.reshape(Nc,3)
+
+        self.refresh_metadata()
 
             
 # Issues:
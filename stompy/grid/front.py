@@ -9,7 +9,11 @@ import pdb
 import unstructured_grid
 import exact_delaunay
 import numpy as np
+import math
 import time
+import heapq
+import bisect
+import collections
 from scipy import optimize as opt
 
 from .. import utils
@@ -25,6 +29,69 @@ except ImportError:
 
 # from numba import jit, int32, float64
 
+GridFields=collections.namedtuple('GridFields',
+                                  ['nodes_x','nodes_fixed','nodes_oring','nodes_ring_f',
+                                   'edges_cells','edges_deleted'])
+
+def one_point_cost_scalar(pnt,edges,target_length=5.0):
+    """ Same as one_point_cost, but looping over the triangles with
+    python floats.  For the handful of triangles around a single node this
+    beats the numpy version, which is dominated by the overhead of many
+    small array operations.
+    edges may also be given as the equivalent nested list of floats, which
+    saves converting it on every call.
+    """
+    if isinstance(edges,np.ndarray):
+        edges=edges.tolist()
+    px,py=float(pnt[0]),float(pnt[1])
+    pi=math.pi
+    max_angle = 85.0*pi/180.
+    sixty=60*pi/180.
+
+    worst_angle=0.0 # largest deviation from 60 degrees
+    max_angle_seen=-1.0
+    min_ab=min_ca=np.inf
+
+    for (ax,ay),(bx,by) in edges:
+        abx=ax-px ; aby=ay-py
+        bcx=bx-ax ; bcy=by-ay
+        cax=px-bx ; cay=py-by
+        # see one_point_cost for the angles via cross/dot
+        for angle in ( pi - math.atan2(cax*aby-cay*abx, cax*abx+cay*aby),
+                       pi - math.atan2(abx*bcy-aby*bcx, abx*bcx+aby*bcy),
+                       pi - math.atan2(bcx*cay-bcy*cax, bcx*cax+bcy*cay) ):
+            worst_angle=max(worst_angle,abs(angle-sixty))
+            max_angle_seen=max(max_angle_seen,angle)
+        l_ab=abx*abx+aby*aby
+        l_ca=cax*cax+cay*cay
+        if l_ab<min_ab:
+            min_ab=l_ab
+        if l_ca<min_ca:
+            min_ca=l_ca
+
+    # see one_point_cost for the reasoning behind these
+    alpha = worst_angle /(max_angle - sixty)
+    angle_penalty = 10*alpha**5
+    scale_rad = 3.0*pi/180.
+    thresh = max_angle - 1.0*scale_rad
+    big_angle_penalty = math.exp( (max_angle_seen - thresh) / scale_rad)
+
+    if min_ab<min_ca:
+        min_len,max_len = min_ab,min_ca
+    else:
+        min_len,max_len = min_ca,min_ab
+    undershoot = target_length**2 / min_len
+    overshoot  = max_len / target_length**2
+    length_factor = 2
+    length_penalty = ( length_factor*(max(undershoot,1) - 1)
+                       + length_factor*(max(overshoot,1) - 1) )
+
+    return angle_penalty + big_angle_penalty + length_penalty
+
+# one_point_cost hands off to one_point_cost_scalar for up to this
+# many triangles - beyond that the numpy version is faster.
+one_point_cost_scalar_max=16
+
 # copied from paver verbatim, with edits to reference
 # numpy identifiers via np._
 # @jit(nopython=True)
@@ -34,28 +101,33 @@ def one_point_cost(pnt,edges,target_length=5.0):
     # pnt is intended to complete a triangle with each
     # pair of points in edges, and should be to the left
     # of each edge
+    if len(edges)<=one_point_cost_scalar_max:
+        return one_point_cost_scalar(pnt,edges,target_length)
+
     penalty = 0
     
     max_angle = 85.0*np.pi/180.
 
-    # all_edges[triangle_i,{ab,bc,ca},{x,y}]
-    all_edges = np.zeros( (edges.shape[0], 3 ,2), np.float64 )
-    
-    # get the edges:
-    all_edges[:,0,:] = edges[:,0] - pnt  # ab
-    all_edges[:,1,:] = edges[:,1] - edges[:,0] # bc
-    all_edges[:,2,:] = pnt - edges[:,1] # ca
+    # get the edges, as separate x,y components:
+    px,py = pnt[0],pnt[1]
+    ax,ay = edges[:,0,0],edges[:,0,1]
+    bx,by = edges[:,1,0],edges[:,1,1]
+    abx,aby = ax-px, ay-py # ab
+    cax,cay = px-bx, py-by # ca
+
+    bcx,bcy = bx-ax, by-ay # bc
 
-    i = np.arange(3)
-    im1 = (i-1)%3
-    
     #--# cost based on angle:
-    abs_angles = np.arctan2( all_edges[:,:,1], all_edges[:,:,0] )
-    all_angles = (np.pi - (abs_angles[:,i] - abs_angles[:,im1]) % (2*np.pi)) % (2*np.pi)
-        
-    # a_angles = (pi - (ab_angles - ca_angles) % (2*pi)) % (2*pi)
-    # b_angles = (pi - (bc_angles - ab_angles) % (2*pi)) % (2*pi)
-    # c_angles = (pi - (ca_angles - bc_angles) % (2*pi)) % (2*pi)
+    # the interior angle at each vertex is pi less the turn from the
+    # incoming to the outgoing edge, and atan2(cross,dot) of the two
+    # edges gives that turn in (-pi,pi], so no modulo is needed.
+    # all_angles[{a,b,c},triangle_i]
+    all_angles = np.pi - np.arctan2( np.array([cax*aby-cay*abx,
+                                               abx*bcy-aby*bcx,
+                                               bcx*cay-bcy*cax]),
+                                     np.array([cax*abx+cay*aby,
+                                               abx*bcx+aby*bcy,
+                                               bcx*cax+bcy*cay]) )
 
     if 1:
         # 60 is what it's been for a while, but I think in one situation
@@ -97,17 +169,16 @@ def one_point_cost(pnt,edges,target_length=5.0):
 
     #--# Length penalties:
     if 1:
-        ab_lens = (all_edges[:,0,:]**2).sum(axis=1)
-        ca_lens = (all_edges[:,2,:]**2).sum(axis=1)
-        min_ab=min(ab_lens)
-        min_ca=min(ca_lens)
+        # python floats from here on, rather than 0-d numpy values
+        min_ab = float( (abx*abx + aby*aby).min() )
+        min_ca = float( (cax*cax + cay*cay).min() )
     else:
         # maybe better for numba?
         min_ab=np.inf
         min_ca=np.inf
         for idx in range(edges.shape[0]):
-            l_ab=(all_edges[idx,0,:]**2).sum()
-            l_ca=(all_edges[idx,2,:]**2).sum()
+            l_ab=abx[idx]**2 + aby[idx]**2
+            l_ca=cax[idx]**2 + cay[idx]**2
             if l_ab<min_ab:
                 min_ab=l_ab
             if l_ca<min_ca:
@@ -117,8 +188,10 @@ def one_point_cost(pnt,edges,target_length=5.0):
     # okay - the problem is that numba doesn't understand the sum
     # above, and thinks that ab_lens is a scalar.
 
-    min_len = min( min_ab,min_ca )
-    max_len = max( min_ab,min_ca )
+    if min_ab<min_ca:
+        min_len,max_len = min_ab,min_ca
+    else:
+        min_len,max_len = min_ca,min_ab
 
     undershoot = target_length**2 / min_len
     overshoot  = max_len / target_length**2
@@ -152,6 +225,11 @@ class Curve(object):
                                            self.points[:1,:] ) )
         
         self.distances=utils.dist_along(self.points)
+        # per-segment interpolants for __call__
+        self.seg_start=self.points[:-1]
+        self.seg_delta=np.diff(self.points,axis=0)
+        with np.errstate(divide='ignore'):
+            self.inv_seg_len=1.0/np.diff(self.distances)
     def __call__(self,f,metric='distance'):
         if metric=='distance':
             if self.closed:
@@ -164,12 +242,39 @@ class Curve(object):
             # the double mod above might solve that
             idxs=np.searchsorted(self.distances,f,side='right') - 1
             
-            alphas = (f - self.distances[idxs]) / (self.distances[idxs+1]-self.distances[idxs])
+            alphas = (f - self.distances[idxs]) * self.inv_seg_len[idxs]
             if not np.isscalar(alphas):
                 alphas = alphas[:,None]
-            return (1-alphas)*self.points[idxs] + alphas*self.points[idxs+1]
+            return self.seg_start[idxs] + alphas*self.seg_delta[idxs]
         else:
             assert False
+
+    _last_idx=0
+    def eval_scalar(self,f):
+        """ Same as self(f) for a single f, with python floats throughout.
+        The segment found last time is checked before searching, since
+        callers (i.e. the optimizer) tend to ask for nearby points.
+        """
+        if self._seg_lists is None:
+            self._seg_lists=( self.distances.tolist(),
+                              self.seg_start.tolist(),
+                              self.seg_delta.tolist(),
+                              self.inv_seg_len.tolist() )
+        distances,seg_start,seg_delta,inv_seg_len=self._seg_lists
+
+        f=float(f)
+        if self.closed:
+            # see __call__ re: double mod
+            f=(f % distances[-1]) % distances[-1]
+        idx=self._last_idx
+        if not (distances[idx]<=f<distances[idx+1]):
+            idx=bisect.bisect_right(distances,f) - 1
+        alpha=(f-distances[idx])*inv_seg_len[idx]
+        self._last_idx=idx
+        (x,y),(dx,dy)=seg_start[idx],seg_delta[idx]
+        return np.array([x+alpha*dx,y+alpha*dy])
+    _seg_lists=None
+
     def total_distance(self):
         return self.distances[-1]
 
@@ -179,95 +284,109 @@ class Curve(object):
           return point, if this is true.
         """
         # def upsample_linearring(points,density,closed_ring=1,return_sources=False):
-        new_segments = []
-        sources = []
-
-        for i,(A,B) in enumerate(zip( self.points[:-1,:],
-                                      self.points[1:,:] ) ):
-            l = utils.dist(B-A)
-            local_scale = scale( 0.5*(A+B) )
-
-            npoints = max(1,round( l/local_scale ))
-            alphas = np.arange(npoints) / float(npoints)
-            alphas=alphas[:,None]
-            
-            new_segment = (1.0-alphas)*A + alphas*B
-            new_segments.append(new_segment)
-            if return_sources:
-                sources.append(self.distances[i] + alphas*l)
-
-        new_points = np.concatenate( new_segments )
+        A=self.points[:-1,:]
+        B=self.points[1:,:]
+        seg_lens=np.diff(self.distances)
+        local_scales=scale( 0.5*(A+B) )
+
+        # floor(x+0.5) rather than np.round, to round halves up
+        nseg=np.maximum(1,np.floor(seg_lens/local_scales+0.5)).astype(np.int64)
+        seg_ids=np.repeat(np.arange(len(A)),nseg)
+        within=np.arange(nseg.sum()) - np.repeat(nseg.cumsum()-nseg,nseg)
+        alphas=(within/nseg[seg_ids].astype(np.float64))[:,None]
+
+        # fill one preallocated output rather than summing temporaries
+        new_points = np.empty( (len(seg_ids),2), np.float64)
+        np.multiply(1.0-alphas,A[seg_ids],out=new_points)
+        new_points += alphas*B[seg_ids]
 
         if return_sources:
-            sources = np.concatenate(sources)
+            sources = self.distances[seg_ids,None] + alphas*seg_lens[seg_ids,None]
             return new_points,sources
         else:
             return new_points
 
     def distance_away(self,anchor_f,signed_distance,rtol=0.05):
-        """  Find a point on the curve signed_distance away from the
-        point corresponding to anchor_f, within the given relative tolerance.
-        returns new_f,new_x.
-
-        If a point could not be found within the requested tolerance, raises
-        a self.CurveException.
-
-        Starting implementation is weak - it ignores any knowledge of the piecewise
-        linear geometry.  Will need to be amended to take that into account, since 
-        in its current state it will succumb to local minima/maxima.
+        """  Find the first point along the curve, starting from anchor_f and
+        heading in the direction of signed_distance, which is
+        abs(signed_distance) away (as the crow flies) from the point at anchor_f.
+        returns new_f,new_x.  new_f is anchor_f plus the signed distance
+        travelled along the curve, without wrapping.
+
+        Each segment is piecewise linear, so the crossing is solved exactly
+        per segment.  rtol is kept for compatibility, but the result is
+        exact to rounding.
+
+        If there is no such point (the curve is too small, or an open curve
+        ends first), raises a self.CurveException.
         """
-        anchor_x = self(anchor_f)
-        offset=signed_distance
-        direc=np.sign(signed_distance)
-        target_d=np.abs(signed_distance)
-
-        last_offset=0.0
-        last_d=0.0
-
-        # first loop to bracket the distance:
-        for step in range(10): # ad-hoc limit to avoid bad juju.
-            new_x=self(anchor_f + offset)
-            d=utils.dist(anchor_x-new_x)
-            rel_err=(d - target_d)/target_d
-            if -rtol < rel_err < rtol:
-                return anchor_f + offset,new_x
-            if rel_err<0:
-                if d<last_d:
-                    # this could easily be a local minimum - as this becomes important,
-                    # then it would be better to include some bounds checking, and only
-                    # fail when we can prove that no solution exists.
-                    raise self.CurveException("Distance got smaller - need to be smarter")
-                last_offset=offset
-                last_d=d
-                offset*=1.5
-                continue
-            else:
-                break # can binary search
-        # binary search
-        low_offset=last_offset
-        high_offset=offset
-        for step in range(10):
-            mid_offset = 0.5*(low_offset + high_offset)
-            mid_x = self(anchor_f + mid_offset)
-            mid_d = utils.dist(anchor_x - mid_x)
-            rel_err=(mid_d - target_d)/target_d
-            if -rtol<rel_err<rtol:
-                return anchor_f+mid_offset,mid_x
-            elif mid_d < target_d:
-                low_offset=mid_offset
+        target_d=abs(signed_distance)
+        direc=1 if signed_distance>=0 else -1
+        D=self.distances[-1]
+        nseg=len(self.seg_start)
+
+        f=anchor_f
+        if self.closed:
+            f=(f % D) % D
+        k=int(np.searchsorted(self.distances,f,side='right') - 1)
+        # open curve, f at the very end
+        k=min(k,nseg-1)
+        x0,y0=self.eval_scalar(f).tolist()
+        seg_start=self.seg_start.tolist()
+        seg_delta=self.seg_delta.tolist()
+        seg_lens=np.diff(self.distances).tolist()
+
+        # parameter of the anchor in segment k
+        s_anchor=(f-self.distances[k])*self.inv_seg_len[k] if seg_lens[k]>0 else 0.0
+        travelled=0.0 # arc length from anchor_f to the start of the search on seg k
+
+        # starting inside the circle of radius target_d around the anchor,
+        # the answer is where the curve first leaves it.  Each segment
+        # is P(s)=start+s*delta, and |P(s)-anchor|**2=target_d**2 is a
+        # quadratic in s.
+        for step in range(nseg+1):
+            (px,py),(dx,dy),L = seg_start[k],seg_delta[k],seg_lens[k]
+            if L>0:
+                wx=px-x0 ; wy=py-y0
+                qa=dx*dx+dy*dy
+                qb=wx*dx+wy*dy
+                qc=wx*wx+wy*wy-target_d*target_d
+                disc=qb*qb-qa*qc
+                if disc>=0:
+                    if direc>0:
+                        s=(-qb+np.sqrt(disc))/qa
+                        s_from=0.0 if step else s_anchor
+                        if s_from<=s<=1.0:
+                            new_f=anchor_f + travelled + (s-s_from)*L
+                            return new_f,np.array([px+s*dx,py+s*dy])
+                    else:
+                        s=(-qb-np.sqrt(disc))/qa
+                        s_from=1.0 if step else s_anchor
+                        if 0.0<=s<=s_from:
+                            new_f=anchor_f - travelled - (s_from-s)*L
+                            return new_f,np.array([px+s*dx,py+s*dy])
+            # on to the next segment
+            if direc>0:
+                travelled+=(1.0 - (s_anchor if step==0 else 0.0))*L
+                k+=1
+                if k==nseg:
+                    if not self.closed:
+                        break
+                    k=0
             else:
-                high_offset=mid_offset
-        else:
-            raise self.CurveException("Binary search failed")
+                travelled+=(s_anchor if step==0 else 1.0)*L
+                k-=1
+                if k<0:
+                    if not self.closed:
+                        break
+                    k=nseg-1
+        raise self.CurveException("No point on the curve is %g away"%target_d)
 
     def is_forward(self,fa,fb,fc):
         """ return true if fa,fb and fc are distinct and
         ordered CCW around the curve
         """
-        if fa==fb or fb==fc or fc==fa:
-            return False
-        d=self.total_distance()
-        return ((fb-fa) % d) < ((fc-fa)%d)
+        return is_forward(fa,fb,fc,self.total_distance())
     def is_reverse(self,fa,fb,fc):
         return self.is_forward(fc,fb,fa)
     
@@ -276,11 +395,33 @@ class Curve(object):
         return ax.plot(self.points[:,0],self.points[:,1],**kw)[0]
         
 
+def is_forward(fa,fb,fc,d):
+    """ return true if fa,fb and fc are distinct and
+    ordered CCW around a closed curve of total length d.
+    Curve.is_forward, for when the caller already has d.
+    """
+    if fa==fb or fb==fc or fc==fa:
+        return False
+    return ((fb-fa) % d) < ((fc-fa) % d)
+
 def internal_angle(A,B,C):
-    BA=A-B
-    BC=C-B
-    theta_BA = np.arctan2( BA[1], BA[0] )
-    theta_BC = np.arctan2( BC[1], BC[0] )
+    # scalar math -- numpy overhead dominates for single points
+    theta_BA = math.atan2( A[1]-B[1], A[0]-B[0] )
+    theta_BC = math.atan2( C[1]-B[1], C[0]-B[0] )
+    return (theta_BA - theta_BC) % (2*math.pi)
+
+def site_angles(node_xy,abc):
+    """
+    vectorized internal_angle, for many sites at once.
+    node_xy: [Nnodes,2] node coordinates
+    abc: [N,3] node indices of each site, with the angle measured at b.
+    returns [N] angles
+    """
+    A=node_xy[abc[:,0]]
+    B=node_xy[abc[:,1]]
+    C=node_xy[abc[:,2]]
+    theta_BA=np.arctan2( A[:,1]-B[:,1], A[:,0]-B[:,0] )
+    theta_BC=np.arctan2( C[:,1]-B[:,1], C[:,0]-B[:,0] )
     return (theta_BA - theta_BC) % (2*np.pi)
 
 class StrategyFailed(Exception):
@@ -591,23 +732,37 @@ class TriangleSite(FrontSite):
         self.grid=af.grid
         assert len(nodes)==3
         self.abc = nodes
+        self._cache={}
+    def invalidate(self):
+        """ drop cached geometry, i.e. after nodes of the site
+        have been moved or replaced
+        """
+        self._cache={}
     def metric(self):
         return self.internal_angle
     def points(self):
-        return self.grid.nodes['x'][ self.abc ]
+        if 'points' not in self._cache:
+            self._cache['points']=np.array(self.af.grid_fields().nodes_x[ self.abc ],np.float64)
+        return self._cache['points']
     
     @property
     def internal_angle(self):
-        A,B,C = self.points() 
-        return internal_angle(A,B,C)
+        if 'internal_angle' not in self._cache:
+            A,B,C = self.points() 
+            self._cache['internal_angle']=internal_angle(A,B,C)
+        return self._cache['internal_angle']
     @property
     def edge_length(self):
-        return utils.dist( np.diff(self.points(),axis=0) ).mean()
+        if 'edge_length' not in self._cache:
+            self._cache['edge_length']=utils.dist( np.diff(self.points(),axis=0) ).mean()
+        return self._cache['edge_length']
     
     @property
     def local_length(self):
-        scale = self.af.scale
-        return scale( self.points().mean(axis=0) )
+        if 'local_length' not in self._cache:
+            scale = self.af.scale
+            self._cache['local_length']=scale( self.points().mean(axis=0) )
+        return self._cache['local_length']
 
     def plot(self,ax=None):
         ax=ax or plt.gca()
@@ -622,7 +777,7 @@ class TriangleSite(FrontSite):
         probably better here, as part of the site.
         """
         a,b,c = self.abc
-        local_length = self.af.scale( self.points().mean(axis=0) )
+        local_length = self.local_length
         
         grid=self.af.grid
         self.resample_status=True
@@ -651,6 +806,8 @@ class TriangleSite(FrontSite):
                         self.abc[0]=n_res
                     else:
                         self.abc[2]=n_res
+        # nodes may have moved, or been replaced
+        self.invalidate()
         return self.resample_status
 
 # without a richer way of specifying the scales, have to start
@@ -866,6 +1023,29 @@ class AdvancingFront(object):
         self.curves.append( curve )
         return len(self.curves)-1
 
+    # Plain ndarray views of the grid fields read in the inner loops,
+    # rather than pulling the field out of the record array on each access.
+    # Rebound whenever the grid replaces its node or edge array (appending,
+    # adding fields...)
+    _grid_fields=None
+    _grid_fields_key=None
+    def grid_fields(self):
+        """ returns a GridFields tuple of nodes_x, nodes_fixed, nodes_oring,
+        nodes_ring_f, edges_cells and edges_deleted for self.grid.
+        Writes to these are writes to the grid.
+        """
+        g=self.grid
+        key=self._grid_fields_key
+        if (key is None) or (key[0] is not g.nodes) or (key[1] is not g.edges):
+            self._grid_fields=GridFields(nodes_x=g.nodes['x'],
+                                         nodes_fixed=g.nodes['fixed'],
+                                         nodes_oring=g.nodes['oring'],
+                                         nodes_ring_f=g.nodes['ring_f'],
+                                         edges_cells=g.edges['cells'],
+                                         edges_deleted=g.edges['deleted'])
+            self._grid_fields_key=(g.nodes,g.edges)
+        return self._grid_fields
+
     def instrument_grid(self,g):
         """
         Add fields to the given grid to support advancing front
@@ -943,13 +1123,20 @@ class AdvancingFront(object):
 
         nodes=[last] # anchor is included
 
+        gf=self.grid_fields()
+        nx=gf.nodes_x
         def pred(n):
             # used to check for SLIDE and degree
-            return self.grid.nodes['fixed'][n]== self.HINT
+            return gf.nodes_fixed[n]== self.HINT
+
+        def seg_len(na,nb):
+            # the span is a sum of lengths, so these do need the sqrt,
+            # but scalar math beats numpy for a single pair
+            (xa,ya),(xb,yb)=nx[na].tolist(),nx[nb].tolist()
+            return math.hypot(xa-xb,ya-yb)
 
         while pred(trav) and (trav != anchor) and (span<max_span):
-            span += utils.dist( self.grid.nodes['x'][last] -
-                                self.grid.nodes['x'][trav] )
+            span += seg_len(last,trav)
             nodes.append(trav)
             if direction==1:
                 he=he.fwd()
@@ -960,8 +1147,7 @@ class AdvancingFront(object):
             else:
                 assert False
         # could use some loop retrofitting..
-        span += utils.dist( self.grid.nodes['x'][last] -
-                            self.grid.nodes['x'][trav] )
+        span += seg_len(last,trav)
         nodes.append(trav)
         return span,nodes
     
@@ -1007,9 +1193,10 @@ class AdvancingFront(object):
             target_span=scale
 
         # first, find a point on the original ring which satisfies the target_span
-        oring=self.grid.nodes['oring'][anchor]-1
+        gf=self.grid_fields()
+        oring=gf.nodes_oring[anchor]-1
         curve = self.curves[oring]
-        anchor_f = self.grid.nodes['ring_f'][anchor]
+        anchor_f = gf.nodes_ring_f[anchor]
         try:
             new_f,new_x = curve.distance_away(anchor_f,direction*target_span)
         except Curve.CurveException as exc:
@@ -1017,6 +1204,12 @@ class AdvancingFront(object):
 
         # check to see if there are other nodes in the way, and remove them.
         nodes_to_delete=[]
+        # python floats, and the curve length once, for the
+        # is_forward calls below
+        curve_len=curve.total_distance()
+        anchor_f=float(anchor_f)
+        new_f=float(new_f)
+        ring_f=gf.nodes_ring_f
         trav=he
         while True:
             if direction==1:
@@ -1030,13 +1223,13 @@ class AdvancingFront(object):
 
             if direction==1:
                 n_trav=trav.node_fwd()
-                f_trav=self.grid.nodes['ring_f'][n_trav]
-                if curve.is_forward( anchor_f, new_f, f_trav ):
+                f_trav=float(ring_f[n_trav])
+                if is_forward( anchor_f, new_f, f_trav, curve_len ):
                     break
             else:
                 n_trav=trav.node_rev()
-                f_trav=self.grid.nodes['ring_f'][n_trav]
-                if curve.is_reverse( anchor_f, new_f, f_trav ):
+                f_trav=float(ring_f[n_trav])
+                if is_forward( f_trav, new_f, anchor_f, curve_len ): # i.e. reverse
                     break
 
             nodes_to_delete.append(n_trav)
@@ -1047,17 +1240,21 @@ class AdvancingFront(object):
         # on the other hand, it may be that the next node is too far away, and it
         # would be better to divide the edge than to shift a node from far away.
         # also possible that our neighbor was RIGID and can't be shifted
+        # merge_edges may have reallocated the grid arrays
+        gf=self.grid_fields()
         method='slide'
-        if (self.grid.nodes['fixed'][n] == self.RIGID):
+        if (gf.nodes_fixed[n] == self.RIGID):
             method='split'
         else:
-            dist_orig = utils.dist( self.grid.nodes['x'][anchor] - self.grid.nodes['x'][n] )
+            delta = gf.nodes_x[anchor] - gf.nodes_x[n]
+            # squared distance, compared against the squared threshold below
+            dist2_orig = float(delta[0]*delta[0] + delta[1]*delta[1])
             # tunable parameter here - how do we decide between shifting a neighbor and
             # dividing the edge.  Larger threshold means shifting nodes from potentially far
             # away, which distorts later steps.  smaller threshold means subdividing, but then
             # there could be the potential to bump into that node during optimization (which
             # is probably okay - we clear out interfering nodes like that).
-            if dist_orig / scale > 1.5: 
+            if dist2_orig > (1.5*scale)**2: # i.e. dist_orig / scale > 1.5
                 method='split'
         if method=='slide':
             self.grid.modify_node(n,x=new_x,ring_f=new_f)
@@ -1071,7 +1268,10 @@ class AdvancingFront(object):
     def resample_neighbors(self,site):
         return site.resample_neighbors()
 
-    def cost_function(self,n):
+    def cost_function(self,n,local_length=None):
+        """ returns a function of x, the cost of placing node n at x.
+        local_length: self.scale at node n, if the caller already has it.
+        """
         raise Exception("Implement in subclass")
 
     def eval_cost(self,n):
@@ -1110,52 +1310,69 @@ class AdvancingFront(object):
         the cost function.  Return the final value of the cost function
         """
         self.log.debug("Relaxing node %d"%n)
-        if self.grid.nodes['fixed'][n] == self.FREE:
+        fixed=self.grid_fields().nodes_fixed[n]
+        if fixed == self.FREE:
             return self.relax_free_node(n)
-        elif self.grid.nodes['fixed'][n] == self.SLIDE:
+        elif fixed == self.SLIDE:
             return self.relax_slide_node(n)
         else:
-            raise Exception("relax_node with fixed=%s"%self.grid.nodes['fixed'][n])
+            raise Exception("relax_node with fixed=%s"%fixed)
+
+    # initial simplex size for relaxing nodes, relative to the local
+    # scale.
+    simplex_scale=0.05
+    def initial_simplex(self,x0,local_length):
+        """ starting simplex for fmin around x0, sized by the local scale.
+        fmin's default perturbs each coordinate by 5% of its value, which
+        for real-world (e.g. UTM) coordinates is many cells away.
+        """
+        x0=np.asarray(x0,np.float64)
+        steps=self.simplex_scale*local_length*np.eye(len(x0))
+        return np.concatenate( (x0[None,:], x0+steps) )
 
     def relax_free_node(self,n):
-        cost=self.cost_function(n)
-        if cost is None:
-            return None
         x0=self.grid.nodes['x'][n]
         local_length=self.scale( x0 )
-        new_x = opt.fmin(cost,
-                         x0,
-                         xtol=local_length*1e-4,
-                         disp=0)
+        cost=self.cost_function(n,local_length=local_length)
+        if cost is None:
+            return None
+        # full_output to get the cost at new_x, rather than evaluating
+        # it again
+        new_x,new_cost = opt.fmin(cost,
+                                  x0,
+                                  xtol=local_length*1e-4,
+                                  initial_simplex=self.initial_simplex(x0,local_length),
+                                  disp=0,full_output=True)[:2]
         dx=utils.dist( new_x - x0 )
         self.log.debug('Relaxation moved node %f'%dx)
         if dx !=0.0:
             self.grid.modify_node(n,x=new_x)
-        return cost(new_x)
+        return new_cost
 
     def relax_slide_node(self,n):
-        cost_free=self.cost_function(n)
+        gf=self.grid_fields()
+        x0=gf.nodes_x[n]
+        local_length=self.scale( x0 )
+        cost_free=self.cost_function(n,local_length=local_length)
         if cost_free is None:
             return 
-        x0=self.grid.nodes['x'][n]
-        f0=self.grid.nodes['ring_f'][n]
-        ring=self.grid.nodes['oring'][n]-1
+        f0=gf.nodes_ring_f[n]
+        ring=gf.nodes_oring[n]-1
 
         assert np.isfinite(f0)
         assert ring>=0
 
         # used to just be f, but I think it's more appropriate to
         # be f[0]
-        cost_slide=lambda f: cost_free( self.curves[ring](f[0]) )
-
-        local_length=self.scale( x0 )
+        cost_slide=lambda f: cost_free( self.curves[ring].eval_scalar(f[0]) )
 
         slide_limits=self.find_slide_limits(n,3*local_length)
         
-        new_f = opt.fmin(cost_slide,
-                         [f0],
-                         xtol=local_length*1e-4,
-                         disp=0)
+        new_f,new_cost = opt.fmin(cost_slide,
+                                  [f0],
+                                  xtol=local_length*1e-4,
+                                  initial_simplex=self.initial_simplex([f0],local_length),
+                                  disp=0,full_output=True)[:2]
 
         if not self.curves[ring].is_forward(slide_limits[0],
                                             new_f,
@@ -1165,7 +1382,7 @@ class AdvancingFront(object):
         
         if new_f[0]!=f0:
             self.slide_node(n,new_f[0]-f0)
-        return cost_slide(new_f)
+        return new_cost
 
     def find_slide_limits(self,n,cutoff=None):
         """ Returns the range of allowable ring_f for n.
@@ -1175,15 +1392,20 @@ class AdvancingFront(object):
         the segments.  So a point which is cutoff away may be much
         closer as the crow flies.
         """
-        n_ring=self.grid.nodes['oring'][n]-1
-        n_f=self.grid.nodes['ring_f'][n]
+        gf=self.grid_fields()
+        ring_f=gf.nodes_ring_f
+        fixed=gf.nodes_fixed
+        edge_cells=gf.edges_cells
+
+        n_ring=gf.nodes_oring[n]-1
+        n_f=ring_f[n]
         curve=self.curves[n_ring]
         L=curve.total_distance()
 
         # find our two neighbors on the ring:check forward:
         nbrs=[]
         for nbr in self.grid.node_to_nodes(n):
-            if self.grid.nodes['oring'][nbr]-1!=n_ring:
+            if gf.nodes_oring[nbr]-1!=n_ring:
                 continue
             nbrs.append(nbr)
         if len(nbrs)>2:
@@ -1191,14 +1413,14 @@ class AdvancingFront(object):
             # and two are along the curve.
             nbrs.append(n)
             # sort them along the ring
-            all_f=(self.grid.nodes['ring_f'][nbrs]-n_f) % L
+            all_f=(ring_f[nbrs]-n_f) % L
             order=np.argsort(all_f)
             nbrs=[ nbrs[order[-1]], nbrs[order[1]] ]
         assert len(nbrs)==2
         
-        if curve.is_forward(self.grid.nodes['ring_f'][nbrs[0]],
+        if curve.is_forward(ring_f[nbrs[0]],
                             n_f,
-                            self.grid.nodes['ring_f'][nbrs[1]] ):
+                            ring_f[nbrs[1]] ):
             pass # already in nice order
         else:
             nbrs=[nbrs[1],nbrs[0]]
@@ -1210,7 +1432,7 @@ class AdvancingFront(object):
             while 1:
                 # beyond cutoff?
                 if ( (cutoff is not None) and
-                     (sgn*(self.grid.nodes['ring_f'][trav[1]] - n_f) )%L > cutoff ):
+                     (sgn*(ring_f[trav[1]] - n_f) )%L > cutoff ):
                     break
                 # is trav[1] something which limits the sliding of n?
                 trav_nbrs=self.grid.node_to_nodes(trav[1])
@@ -1220,7 +1442,7 @@ class AdvancingFront(object):
                 #     break
 
                 # the transition to HINT
-                if self.grid.nodes['fixed'][trav[1]] != self.HINT:
+                if fixed[trav[1]] != self.HINT:
                     break
                 
                 for nxt in trav_nbrs:
@@ -1230,7 +1452,7 @@ class AdvancingFront(object):
                 # a cell on it.  If it does, then even if the node is degree
                 # 2, we can't slide through it.
                 j=self.grid.nodes_to_edge( [trav[1],nxt] )
-                j_c=self.grid.edges['cells'][j]
+                j_c=edge_cells[j]
                 if j_c[0]>=0 or j_c[1]>=0:
                     # adjacent cells, can't slide through here.
                     break
@@ -1238,11 +1460,30 @@ class AdvancingFront(object):
                 trav=[trav[1],nxt]
             stops.append(trav[1])
             
-        return self.grid.nodes['ring_f'][ stops ]
+        return ring_f[ stops ]
     
+    def ring_step(self,prev,cur,direction):
+        """ 
+        Step along the front from prev to cur and on to the next node,
+        returning that node.  direction is 1 when prev->cur is a forward
+        halfedge, -1 when it is reversed (i.e. cur->prev is forward).
+        For a degree 2 node, as on a boundary, that is just the other
+        neighbor, and skips sorting the neighbors by angle.
+        """
+        nbrs=self.grid.node_to_nodes(cur)
+        if len(nbrs)==2:
+            return nbrs[0] if nbrs[1]==prev else nbrs[1]
+        if direction==1:
+            return self.grid.nodes_to_halfedge(prev,cur).fwd().node_fwd()
+        else:
+            return self.grid.nodes_to_halfedge(cur,prev).rev().node_rev()
+
     def find_slide_conflicts(self,n,delta_f):
-        n_ring=self.grid.nodes['oring'][n]-1
-        n_f=self.grid.nodes['ring_f'][n]
+        gf=self.grid_fields()
+        ring_f=gf.nodes_ring_f
+        oring=gf.nodes_oring
+        n_ring=oring[n]-1
+        n_f=ring_f[n]
         new_f=n_f + delta_f
         curve=self.curves[n_ring]
         # Want to find edges in the direction of travel
@@ -1253,10 +1494,10 @@ class AdvancingFront(object):
         # do things a bit more manually.
         to_delete=[]
         for nbr in self.grid.node_to_nodes(n):
-            if self.grid.nodes['oring'][nbr]-1!=n_ring:
+            if oring[nbr]-1!=n_ring:
                 continue
 
-            nbr_f=self.grid.nodes['ring_f'][nbr]
+            nbr_f=ring_f[nbr]
             if self.grid.node_degree(nbr)!=2:
                 continue
 
@@ -1266,11 +1507,10 @@ class AdvancingFront(object):
                 if curve.is_forward(n_f,n_f+delta_f,nbr_f):
                     continue
                 to_delete.append(nbr)
-                he=self.grid.nodes_to_halfedge(n,nbr)
+                prev=n
                 while 1:
-                    he=he.fwd()
-                    nbr=he.node_fwd()
-                    nbr_f=self.grid.nodes['ring_f'][nbr]
+                    prev,nbr=nbr,self.ring_step(prev,nbr,1)
+                    nbr_f=ring_f[nbr]
                     if curve.is_forward(n_f,n_f+delta_f,nbr_f):
                         break
                     to_delete.append(nbr)
@@ -1279,18 +1519,17 @@ class AdvancingFront(object):
                 if curve.is_reverse(n_f,n_f+delta_f,nbr_f):
                     continue
                 to_delete.append(nbr)
-                he=self.grid.nodes_to_halfedge(nbr,n)
+                prev=n
                 while 1:
-                    he=he.rev()
-                    nbr=he.node_rev()
-                    nbr_f=self.grid.nodes['ring_f'][nbr]
+                    prev,nbr=nbr,self.ring_step(prev,nbr,-1)
+                    nbr_f=ring_f[nbr]
                     if curve.is_reverse(n_f,n_f+delta_f,nbr_f):
                         break
                     to_delete.append(nbr)
                 break
         # sanity checks:
         for nbr in to_delete:
-            assert n_ring==self.grid.nodes['oring'][nbr]-1
+            assert n_ring==oring[nbr]-1
             # OLD COMMENT:
             # For now, depart a bit from paver, and rather than
             # having HINT nodes, HINT and SLIDE are both fixed=SLIDE,
@@ -1298,7 +1537,7 @@ class AdvancingFront(object):
             # NEW COMMENT:
             # actually, that was a bad idea.  better to stick with
             # how it was in paver
-            assert self.grid.nodes['fixed'][nbr]==self.HINT # SLIDE
+            assert gf.nodes_fixed[nbr]==self.HINT # SLIDE
             assert self.grid.node_degree(nbr)==2
         return to_delete
     
@@ -1307,12 +1546,14 @@ class AdvancingFront(object):
         for nbr in conflicts:
             self.grid.merge_edges(node=nbr)
 
-        n_ring=self.grid.nodes['oring'][n]-1
-        n_f=self.grid.nodes['ring_f'][n]
+        # after the merges, since they may reallocate the grid arrays
+        gf=self.grid_fields()
+        n_ring=gf.nodes_oring[n]-1
+        n_f=gf.nodes_ring_f[n]
         new_f=n_f + delta_f
         curve=self.curves[n_ring]
 
-        self.grid.modify_node(n,x=curve(new_f),ring_f=new_f)
+        self.grid.modify_node(n,x=curve.eval_scalar(new_f),ring_f=new_f)
 
     def loop(self,count=0):
         while 1:
@@ -1381,28 +1622,160 @@ class AdvancingTriangles(AdvancingFront):
     def set_edge_scale(self,scale):
         self.scale=scale
 
-    def enumerate_sites(self):
-        sites=[]
-        # FIX: This doesn't scale!
-        valid=(self.grid.edges['cells'][:,:]==self.grid.UNMESHED) 
-        J,Orient = np.nonzero(valid)
-
-        for j,orient in zip(J,Orient):
-            if self.grid.edges['deleted'][j]:
-                continue
+    def halfedge_site_nodes(self,J,Orient):
+        """
+        J,Orient: unmeshed halfedges, each the first leg (a->b) of a site.
+        returns an [N,3] integer array, with the nodes a,b,c of each site.
+        """
+        abc=np.zeros( (len(J),3), np.int32)
+        for i,(j,orient) in enumerate(zip(J,Orient)):
             he=self.grid.halfedge(j,orient)
             he_nxt=he.fwd()
-            a=he.node_rev()
             b=he.node_fwd()
-            bb=he_nxt.node_rev()
-            c=he_nxt.node_fwd()
-            assert b==bb
+            assert b==he_nxt.node_rev()
+            abc[i]=[he.node_rev(),b,he_nxt.node_fwd()]
+        return abc
 
-            sites.append( TriangleSite(self,nodes=[a,b,c]) )
-        return sites
+    def unmeshed_halfedges(self,edges=None):
+        """ returns J,Orient for the unmeshed halfedges of the given
+        edges, defaulting to all edges.
+        """
+        if edges is None:
+            edges=slice(None)
+            J0=None
+        else:
+            J0=edges=np.asarray(edges,np.int32)
+        gf=self.grid_fields()
+        valid=(gf.edges_cells[edges,:]==self.grid.UNMESHED) 
+        valid &= ~gf.edges_deleted[edges,None]
+        J,Orient = np.nonzero(valid)
+        if J0 is not None:
+            J=J0[J]
+        return J,Orient
+
+    def enumerate_site_nodes(self):
+        """ 
+        returns an [N,3] integer array, with the nodes a,b,c of each
+        potential TriangleSite.
+        """
+        return self.halfedge_site_nodes(*self.unmeshed_halfedges())
 
-    def cost_function(self,n):
-        local_length = self.scale( self.grid.nodes['x'][n] )
+    def enumerate_sites(self):
+        return [ TriangleSite(self,nodes=list(nodes))
+                 for nodes in self.enumerate_site_nodes() ]
+
+    # choose_site keeps a heap of (angle,j,orient) for the unmeshed
+    # halfedges, and only rescores sites near nodes which the grid reports
+    # as touched.  Entries are not removed when a site changes, but are
+    # checked against the current grid when they come to the top.
+    site_heap=None
+    site_heap_grid=None
+    site_heap_dirty=None
+
+    def choose_site(self):
+        """
+        Same as AdvancingFront.choose_site, but incremental: the angles
+        of all sites are computed on the first call, and after that only
+        sites around nodes touched by grid edits are rescored.
+        """
+        self.update_site_heap()
+        heap=self.site_heap
+        while heap:
+            angle,j,orient=heap[0]
+            abc,angles=self.score_halfedges([j],[orient])
+            if len(abc)==0:
+                heapq.heappop(heap) # no longer a site
+            elif angles[0]==angle:
+                return TriangleSite(self,nodes=list(abc[0]))
+            else:
+                # stale - normally the site was pushed again when it
+                # changed, but push the current angle to be sure.
+                heapq.heapreplace(heap,(angles[0],j,orient))
+        return None
+
+    def score_halfedges(self,J,Orient):
+        """ returns abc,angles for those of the given halfedges which 
+        are still valid sites """
+        J=np.asarray(J,np.int32)
+        Orient=np.asarray(Orient,np.int32)
+        gf=self.grid_fields()
+        if len(J):
+            valid=(gf.edges_cells[J,Orient]==self.grid.UNMESHED)
+            valid &= ~gf.edges_deleted[J]
+            J=J[valid]
+            Orient=Orient[valid]
+        abc=self.halfedge_site_nodes(J,Orient)
+        return abc,site_angles(gf.nodes_x,abc)
+
+    def update_site_heap(self):
+        g=self.grid
+        if ( (self.site_heap is None)
+             or (self.site_heap_grid is not g)
+             or (len(self.site_heap)>4*(g.Nedges()+1)) ):
+            # full rebuild
+            if self.site_heap_grid is not g:
+                for func_name in ['add_edge','modify_edge','modify_node',
+                                  'add_cell','modify_cell']:
+                    g.subscribe_after(func_name,self.on_grid_edit)
+                for func_name in ['delete_edge','modify_edge','delete_node',
+                                  'delete_cell','modify_cell']:
+                    g.subscribe_before(func_name,self.on_grid_edit)
+                self.site_heap_grid=g
+            J,Orient=self.unmeshed_halfedges()
+            angles=self.score_halfedges(J,Orient)[1]
+            self.site_heap=list(zip(angles.tolist(),J.tolist(),Orient.tolist()))
+            heapq.heapify(self.site_heap)
+            self.site_heap_dirty=set()
+            return
+
+        if not self.site_heap_dirty:
+            return
+        # a site a-b-c depends on the cells of a-b, the position of its
+        # nodes, and which edge leaves b next, which in turn depends on the
+        # neighbors of b.  So rescore every halfedge on an edge touching
+        # a dirty node or one of its neighbors.
+        dirty=self.site_heap_dirty
+        self.site_heap_dirty=set()
+        edges=set()
+        for n in dirty:
+            if n<0 or n>=g.Nnodes() or g.nodes['deleted'][n]:
+                continue
+            for nbr in [n]+list(g.node_to_nodes(n)):
+                edges.update(g.node_to_edges(nbr))
+        J,Orient=self.unmeshed_halfedges(sorted(edges))
+        abc,angles=self.score_halfedges(J,Orient)
+        for entry in zip(angles.tolist(),J.tolist(),Orient.tolist()):
+            heapq.heappush(self.site_heap,entry)
+
+    def on_grid_edit(self,g,func_name,*a,**k):
+        """ grid listener, marks nodes whose sites may need rescoring """
+        if self.site_heap_dirty is None or g is not self.site_heap_grid:
+            return
+        dirty=self.site_heap_dirty
+        if a:
+            idx=a[0]
+        else:
+            idx=k.get('return_value',None)
+            for key in ['j','c','n','i']:
+                if key in k:
+                    idx=k[key]
+        if func_name in ('add_node','modify_node','delete_node'):
+            dirty.add(idx)
+        elif func_name in ('add_edge','modify_edge','delete_edge'):
+            if 'nodes' in k:
+                dirty.update(k['nodes'])
+            if idx is not None and idx<g.Nedges():
+                dirty.update(g.edges['nodes'][idx])
+        elif func_name in ('add_cell','modify_cell','delete_cell'):
+            if 'nodes' in k:
+                dirty.update(k['nodes'])
+            if idx is not None and idx<g.Ncells():
+                dirty.update(g.cell_to_nodes(idx))
+
+    def cost_function(self,n,local_length=None):
+        nx=self.grid_fields().nodes_x
+        if local_length is None:
+            local_length = self.scale( nx[n] )
         my_cells = self.grid.node_to_cells(n)
 
         if len(my_cells) == 0:
@@ -1425,10 +1798,17 @@ class AdvancingTriangles(AdvancingFront):
                 cell_nodes[j,0] = cell_nodes[j,2] # otherwise, already set
 
         edges = cell_nodes[:,:2]
-        edge_points = self.grid.nodes['x'][edges]
-
-        def cost(x,edge_points=edge_points,local_length=local_length):
-            return one_point_cost(x,edge_points,target_length=local_length)
+        edge_points = nx[edges].astype(np.float64)
+
+        # the optimizer calls this many times for the same edges - settle
+        # the implementation and any conversion up front.
+        if len(edge_points)<=one_point_cost_scalar_max:
+            edge_list=edge_points.tolist()
+            def cost(x):
+                return one_point_cost_scalar(x,edge_list,local_length)
+        else:
+            def cost(x):
+                return one_point_cost(x,edge_points,local_length)
 
         return cost
 
@@ -1543,7 +1923,7 @@ class AdvancingQuads(AdvancingFront):
             sites.append( QuadSite(self,nodes=[a,b,c,d]) )
         return sites
 
-    def cost_function(self,n):
+    def cost_function(self,n,local_length=None):
         local_para = self.para_scale
         local_perp = self.perp_scale
 
@@ -248,16 +248,16 @@ class UnstructuredGrid(Listenable,undoer.OpHistory):
     # just consequences of the rest of the topology, the assumed invariant is that
     # (outside of initialization or during modification), they are kept consistent.
     
-    node_dtype = [ ('x',(np.float64,2)),('deleted',np.bool8) ]
+    node_dtype = [ ('x',(np.float64,2)),('deleted',np.bool_) ]
     cell_dtype  = [ # edges/nodes are set dynamically in __init__ since max_sides can change
                     ('_center',(np.float64,2)),  # typ. voronoi center
                     ('mark',np.int32),
                     ('_area',np.float64),
-                    ('deleted',np.bool8)]
+                    ('deleted',np.bool_)]
     edge_dtype = [ ('nodes',(np.int32,2)),
                    ('mark',np.int32),
                    ('cells',(np.int32,2)),
-                   ('deleted',np.bool8)]
+                   ('deleted',np.bool_)]
 
     ##
     def __init__(self,
@@ -662,7 +662,7 @@ class UnstructuredGrid(Listenable,undoer.OpHistory):
         
         node_map[:]=-999
         # and this after truncating nodes:
-        node_map[:-1][nsort] = np.arange(self.Nnodes())
+        node_map[:-1][nsort[:Nactive]] = np.arange(self.Nnodes())
         node_map[-1] = -1 # missing nodes map -1 to -1
 
         self.edges['nodes'] = node_map[self.edges['nodes']]
@@ -1199,8 +1199,10 @@ class UnstructuredGrid(Listenable,undoer.OpHistory):
         angles=np.arctan2(diffs[:,1],diffs[:,0])
         nbrs=nbrs[np.argsort(angles)]
         if ref_nbr is not None: 
-            i=list(nbrs).index(ref_nbr)
-            nbrs=np.roll(nbrs,-i)
+            i=np.nonzero(nbrs==ref_nbr)[0]
+            if len(i)==0:
+                raise ValueError("%s is not a neighbor of %d"%(ref_nbr,n))
+            nbrs=np.roll(nbrs,-i[0])
         return nbrs
 
     def build_node_to_cells(self):
@@ -2426,7 +2428,7 @@ class UnstructuredGrid(Listenable,undoer.OpHistory):
         returns: bitmask overcells, with non-deleted, selected edges set and others False.
         if invert is True, select edges which do not intersect the the given geometry.  
         """
-        sel = np.zeros(self.Nedges(),np.bool8) # initialized to False
+        sel = np.zeros(self.Nedges(),np.bool_) # initialized to False
         for j in range(self.Nedges()):
             if self.edges['deleted'][j]:
                 continue
@@ -2537,7 +2539,7 @@ class UnstructuredGrid(Listenable,undoer.OpHistory):
         return strings
 
     def select_nodes_intersecting(self,geom=None,xxyy=None,invert=False,as_type='mask'):
-        sel = np.zeros(self.Nnodes(),np.bool8) # initialized to False
+        sel = np.zeros(self.Nnodes(),np.bool_) # initialized to False
 
         assert (geom is not None) or (xxyy is not None)
 
@@ -2564,7 +2566,7 @@ class UnstructuredGrid(Listenable,undoer.OpHistory):
         finite cell.
         """
         if as_type is 'mask':
-            sel = np.zeros(self.Ncells(),np.bool8) # initialized to False
+            sel = np.zeros(self.Ncells(),np.bool_) # initialized to False
         else:
             sel = []
 
@@ -2599,7 +2601,7 @@ class UnstructuredGrid(Listenable,undoer.OpHistory):
         delta: size of finite difference used in determining the orientation
         of the cut.
         """
-        marks=np.zeros(self.Ncells(),np.bool8)
+        marks=np.zeros(self.Ncells(),np.bool_)
 
         def test_edge(j):
             cells=self.edges['cells'][j]
@@ -3579,7 +3581,7 @@ class UnTRIM08Grid(UnstructuredGrid):
         # NB: these depths are as soundings - positive down.
         super(UnTRIM08Grid,self).__init__( extra_cell_fields = extra_cell_fields + [('depth_mean',np.float64),
                                                                                     ('depth_max',np.float64),
-                                                                                    ('red',np.bool8),
+                                                                                    ('red',np.bool_),
                                                                                     ('subgrid',object)],
                                            extra_edge_fields = extra_edge_fields + [('depth_mean',np.float64),
                                                                                     ('depth_max',np.float64),
@@ -3836,7 +3838,7 @@ class UnTRIM08Grid(UnstructuredGrid):
             else:
                 overwrite=True
                 selector = np.asarray(selector)
-                if selector.dtype == np.bool8:
+                if selector.dtype == np.bool_:
                     selector = np.nonzero( selector )[0]
 
             # so now selector is iterable, but still doesn't account for deleted elements
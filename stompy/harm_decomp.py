@@ -1,75 +1,242 @@
 # harmonic decomposition
+from __future__ import print_function
 
-from safe_pylab import *
-from numpy import *
-from numpy.linalg import norm,qr,pinv
-import tide_consts    
+import numpy as np
+from numpy.linalg import cond,LinAlgError
+from scipy.linalg import cho_factor,cho_solve,qr,solve_triangular
+from scipy.signal import lfilter
+from collections import OrderedDict
+from . import tide_consts
 
 
 ###
 def recompose(t,comps,omegas):
-    d = zeros(t.shape,float64)
-    
-    for i in range(len(omegas)):
-        d += comps[i,0] * cos(t*omegas[i] - comps[i,1])
-    return d
+    # phase[constituent,time], reused in place for the cosines
+    phase = np.multiply.outer(np.asarray(omegas,np.float64),np.ravel(t))
+    phase -= comps[:,1,None]
+    d = np.cos(phase,out=phase)
+    return np.dot(comps[:,0],d).reshape(t.shape)
             
-def decompose(t,h,omegas):
+def uniform_spacing(t,rtol=1e-6):
+    """ if t is evenly spaced, to within rtol of the spacing, return the 
+    spacing, otherwise None
+    """
+    if len(t)<2:
+        return None
+    dt=(t[-1]-t[0])/(len(t)-1.0)
+    if dt==0:
+        return None
+    t_even=t[0] + dt*np.arange(len(t))
+    if np.abs(t-t_even).max() > rtol*np.abs(dt):
+        return None
+    return dt
+
+def uniform_normal_matrix(t0,dt,M,omegas):
+    """ A^T A for the harmonic basis of decompose(), sampled at M times
+    t0 + n*dt, n=0..M-1.  Each entry is a sum of cos/sin over an evenly
+    spaced series, which has a closed form, so this is O(N^2) rather than
+    O(M*N^2).
+    """
+    def expsum(w):
+        # sum_n exp(i w t_n), via the Dirichlet kernel
+        x=0.5*w*dt
+        sx=np.sin(x)
+        small=np.abs(sx)<1e-8
+        sx[small]=1.0 # avoid 0/0, filled in below
+        D=np.sin(M*x)/sx
+        # limit as sin(x)->0
+        D[small]=M*np.cos(M*x[small])/np.cos(x[small])
+        return np.exp(1j*w*(t0+0.5*(M-1)*dt)) * D
+
+    w_diff=np.subtract.outer(omegas,omegas)
+    w_sum=np.add.outer(omegas,omegas)
+    Zd=expsum(w_diff)
+    Zs=expsum(w_sum)
+
+    N=len(omegas)
+    AtA=np.empty( (2*N,2*N), np.float64)
+    # cos a cos b = (cos(a-b)+cos(a+b))/2, etc.
+    AtA[0::2,0::2]=0.5*(Zd.real+Zs.real)
+    AtA[1::2,1::2]=0.5*(Zd.real-Zs.real)
+    # [j,k]: cos(w_j t) sin(w_k t)
+    AtA[0::2,1::2]=0.5*(Zs.imag-Zd.imag)
+    AtA[1::2,0::2]=AtA[0::2,1::2].T
+    return AtA
+
+def dot_T(A,h,block=2**16):
+    """ A.T.h, summed in float64 even when A is single precision.  A is
+    upcast a block of rows at a time, rather than all at once.
+    """
+    if A.dtype==np.float64:
+        return np.dot(A.T,h)
+    Ath=np.zeros( (A.shape[1],)+h.shape[1:], np.float64)
+    for start in range(0,len(A),block):
+        Ath+=np.dot(A[start:start+block].T.astype(np.float64),
+                    h[start:start+block])
+    return Ath
+
+def qr_factor(A):
+    """ rank-revealing QR of A, for least squares when A is poorly
+    conditioned.  Returns (Q,R,perm), with Q and R truncated to the
+    numerical rank.
+    """
+    Q,R,perm = qr(A,mode='economic',pivoting=True,check_finite=False)
+    diag_R=np.abs(np.diagonal(R))
+    rank=(diag_R > np.finfo(R.dtype).eps*max(A.shape)*diag_R[0]).sum()
+    return Q[:,:rank],R[:rank,:rank],perm
+
+def qr_solve(A_qr,h):
+    """ least squares solution of A x = h given qr_factor(A).  Columns
+    beyond the rank of A get a coefficient of 0.
+    """
+    Q,R,perm = A_qr
+    x=np.zeros((len(perm),)+h.shape[1:],np.float64)
+    x[perm[:len(R)]]=solve_triangular(R,dot_T(Q,h),check_finite=False)
+    return x
+
+def col_cache_extra_bytes(col_cache,A):
+    """ bytes held by the cached column views of decompose(), not counting
+    the basis matrix A which is retained regardless.
+    """
+    bases={}
+    for cols in col_cache.values():
+        if cols.base is not A:
+            bases[id(cols.base)]=cols.base.nbytes
+    return sum(bases.values())
+
+def decompose(t,h,omegas,dtype=np.float64):
     """ take an arbitrary timeseries defined by times t and values h plus a list
     of N frequencies omegas, which must be ANGULAR frequencies (don't forget the 2pi)
     
     return comps as an Nx2 array, where comps[:,0] are the amplitudes and comps[:,1]
     are the phases.
 
+    h may also be 2-D, [len(t),K], for K timeseries sharing the same times,
+    which are then fit together, and comps is Nx2xK.
+
     super cheap caching: remembers the last t and omegas, and if they are the same
     it will reuse the matrix from before.
+
+    dtype: precision of the basis matrix.  float32 halves the memory of
+    the cached basis for long records.  Only the stored basis values are
+    rounded to single precision - phases, the sums of A.T h, and the
+    small normal-equation factorization are all computed in float64.
     """
     def sim(a,b):
         if a is b:
             return True
         if a is None or b is None:
             return False
-        return (a.shape == b.shape) and allclose(a,b)
-    if sim(decompose.cached_t,t) and sim(decompose.cached_omegas,omegas):
-        Ainv = decompose.cached_Ainv
+        if a.shape != b.shape or a.dtype != b.dtype:
+            return False
+        # a different record usually shows at the ends, before paying
+        # for the full comparison
+        if a.size and (a[0]!=b[0] or a[-1]!=b[-1]):
+            return False
+        # exact match - a single pass, where allclose makes several
+        return np.array_equal(a,b)
+    # omegas are short, so key them by value
+    omegas_key=tuple(np.asarray(omegas,np.float64).ravel().tolist())
+    h=np.asarray(h,np.float64)
+    same_t=sim(decompose.cached_t,t)
+    if ( same_t and (decompose.cached_omegas==omegas_key)
+         and decompose.cached_solver[0].dtype==dtype ):
+        A,AtA_cho,A_qr = decompose.cached_solver
     else:
         # A is a matrix of basis functions - two (cos/sin) for each frequency
         n_bases = 2*len(omegas)
         basis_len = len(h)
 
         # form the linear system
-        # each column of A is a basis function
-        A = zeros( (basis_len,n_bases), float64)
+        # each column of A is a basis function, cos/sin interleaved
+        A = np.empty( (basis_len,n_bases), dtype)
 
-        for i in range(len(omegas)):
-            A[:,2*i] = cos(omegas[i]*t)
-            A[:,2*i+1] = sin(omegas[i]*t)
+        # cos/sin columns are remembered per frequency for the last t, so
+        # fitting different subsets of constituents to the same record
+        # only evaluates the trig functions once.
+        col_cache=decompose.col_cache
+        if not same_t:
+            col_cache.clear()
+        missing=[]
+        for i,omega in enumerate(omegas_key):
+            k=(omega,A.dtype.char)
+            cols=col_cache.get(k)
+            if cols is None:
+                missing.append(i)
+            else:
+                A[:,2*i:2*i+2]=cols
+        if missing:
+            if len(missing)==len(omegas_key):
+                phase = np.multiply.outer(t,omegas)
+                np.cos(phase,out=A[:,0::2])
+                np.sin(phase,out=A[:,1::2])
+            else:
+                missing=np.array(missing)
+                phase = np.multiply.outer(t,np.asarray(omegas_key)[missing])
+                A[:,2*missing]=np.cos(phase)
+                A[:,2*missing+1]=np.sin(phase,out=phase)
+        # the cache holds views into A, which is kept anyway.  Columns
+        # only found in earlier bases keep those whole matrices alive, so
+        # drop the oldest until that extra memory is within budget.
+        for i,omega in enumerate(omegas_key):
+            k=(omega,A.dtype.char)
+            col_cache.pop(k,None)
+            col_cache[k]=A[:,2*i:2*i+2]
+        while col_cache_extra_bytes(col_cache,A)>decompose.col_cache_bytes:
+            col_cache.popitem(last=False)
 
-        Ainv = pinv(A)
+        # least squares via the normal equations, with a Cholesky
+        # factorization of A^T A, rather than forming pinv(A).  If A^T A
+        # is not numerically positive definite, or close enough to it that
+        # squaring the condition number costs real precision (i.e.
+        # frequencies which the record can't separate), fall back to a
+        # QR factorization of A with column pivoting.
+        # evenly spaced times, as is typical, have a closed form A^T A.
+        dt=uniform_spacing(t)
+        if dt is not None:
+            AtA=uniform_normal_matrix(t[0],dt,len(t),omegas)
+        else:
+            A64=A.astype(np.float64,copy=False)
+            AtA=np.dot(A64.T,A64)
+        AtA_cho=A_qr=None
+        try:
+            AtA_cho = cho_factor( AtA, check_finite=False )
+            diag_R=np.abs(np.diagonal(AtA_cho[0]))
+            # diag_R ratio ~ cond(A).  The normal equations lose about
+            # cond(A)**2 * eps, so the limit depends on the precision of A
+            if diag_R.min() < 100*np.sqrt(np.finfo(dtype).eps)*diag_R.max():
+                AtA_cho=None
+        except LinAlgError:
+            pass
+        if AtA_cho is None:
+            A_qr=qr_factor(A)
 
-        decompose.cached_Ainv=Ainv
+        decompose.cached_solver=(A,AtA_cho,A_qr)
         decompose.cached_t = t.copy()
-        decompose.cached_omegas = omegas.copy()
+        decompose.cached_omegas = omegas_key
         
         # and can we say anything about the conditioning of A ?
-        def cond_num(L):
-            return norm(L,ord=2)*norm(pinv(L),ord=2)
-
-        # sort of arbitrary...
-        cnum = cond_num(A)
-        if cnum > 10:
-            print "Harmonic decomposition: condition number may be too high: ",cnum
+        # costs an SVD of A, so only on request
+        if decompose.check_cond:
+            # sort of arbitrary...
+            cnum = cond(A)
+            if cnum > 10:
+                print("Harmonic decomposition: condition number may be too high: ",cnum)
         
-    x=dot(Ainv,h)
+    if AtA_cho is not None:
+        Ath=dot_T(A,h)
+        x=cho_solve(AtA_cho,Ath,check_finite=False)
+    else:
+        x=qr_solve(A_qr,h)
 
     # now rows are constituents, and we get the cos/sin as two columns
-    comps = reshape(x,(len(omegas),2))
+    comps = np.reshape(x,(len(omegas),2)+h.shape[1:])
 
     # now transform cos/sin into amp/phase
-    x_amps = sqrt( comps[:,0]**2 + comps[:,1]**2 )
+    x_amps = np.sqrt( comps[:,0]**2 + comps[:,1]**2 )
 
     #
-    x_phis = arctan2( comps[:,1], comps[:,0] )
+    x_phis = np.arctan2( comps[:,1], comps[:,0] )
 
     # rewrite comps using the amp/phase
     comps[:,0] = x_amps
@@ -78,12 +245,42 @@ def decompose(t,h,omegas):
     if 0:
         # check to see how close we are:
         recomposed = recompose(t,comps,omegas)
-        rms = sqrt( ((h - recomposed)**2).mean() )
+        rms = np.sqrt( ((h - recomposed)**2).mean() )
 
-        print "RMS Error:",rms
+        print("RMS Error:",rms)
     
     return comps
 
+def decompose_goertzel(t,h,omegas):
+    """ like decompose(), but each frequency is extracted on its own as a
+    single DFT bin, via the Goertzel recurrence.  O(len(t)) per frequency
+    and no basis matrix, so cheap for pulling out a few constituents.
+
+    t must be evenly spaced.  This is a projection rather than a joint
+    least-squares fit, so it only agrees with decompose() when the
+    constituents are resolved by the record, i.e. frequencies separated
+    by well over 2pi/(t[-1]-t[0]).
+    """
+    dt=uniform_spacing(t)
+    if dt is None:
+        raise ValueError("decompose_goertzel requires evenly spaced t")
+    M=len(t)
+    comps=np.zeros( (len(omegas),2), np.float64)
+    for i,omega in enumerate(omegas):
+        w=omega*dt
+        # s[n] = h[n] + 2 cos(w) s[n-1] - s[n-2], run as an IIR filter
+        s=lfilter([1.0],[1.0,-2*np.cos(w),1.0],h)
+        s_prev=s[-2] if M>1 else 0.0
+        # sum_n h[n] exp(-i omega t[n])
+        Z=(s[-1]-np.exp(-1j*w)*s_prev) * np.exp(-1j*(w*(M-1)+omega*t[0]))
+        if np.abs(np.sin(w))<1e-12:
+            # mean or nyquist - only the cosine term exists
+            comps[i,0]=np.abs(Z)/M
+        else:
+            comps[i,0]=2*np.abs(Z)/M
+        comps[i,1]=-np.angle(Z)
+    return comps
+
 def noaa_37_names():
     """ return names of the 37 constituents provided in NOAA harmonic data
     """
@@ -102,27 +299,39 @@ def noaa_37_omegas():
     return omega_per_sec
     
 
+# constant - no need to look the constituents up on every call
+NOAA37_OMEGAS=noaa_37_omegas()
+NOAA37_OMEGAS.flags.writeable=False
+
 def decompose_noaa37(t,h):
-    return decompose(t,h,noaa_37_omegas())
+    return decompose(t,h,NOAA37_OMEGAS)
 
 
 decompose.cached_t = None
 decompose.cached_omegas = None
+# cos/sin basis columns for decompose.cached_t, keyed by frequency, LRU.
+# entries are views into basis matrices, and col_cache_bytes limits the
+# memory held beyond the current basis.
+decompose.col_cache = OrderedDict()
+decompose.col_cache_bytes = 2**26
+# set to True to warn when the basis is poorly conditioned
+decompose.check_cond = False
 
 if __name__ == '__main__':
     # A sample problem:
-    omegas = array([1.0,0.0])
+    omegas = np.array([1.0,0.0])
 
     # the constructed data:
-    amps = array([1,5.0])
-    phis = array([1,0])
+    amps = np.array([1,5.0])
+    phis = np.array([1,0])
 
-    t = linspace(0,10*pi,125)
-    h = amps[0]*cos(omegas[0]*t - phis[0]) + amps[1]*cos(omegas[1]*t - phis[1])
+    t = np.linspace(0,10*np.pi,125)
+    h = amps[0]*np.cos(omegas[0]*t - phis[0]) + amps[1]*np.cos(omegas[1]*t - phis[1])
 
-    plot(t,h)
+    import matplotlib.pyplot as plt
+    plt.plot(t,h)
 
     comps = decompose(t,h,omegas)
 
-    print "Components: ",comps
+    print("Components: ",comps)
 
@@ -2,6 +2,7 @@
 # This is a straightforward translation of the predicates in triangle.c into
 # python.
 
+import numpy as np
 
 ## Initialization:
 #  There is a bit of dynamic work which happens on import to figure out
@@ -826,6 +827,138 @@ def orientation(a,b,c):
     """
     return cmp( counterclockwise(a,b,c),0 )
 
+def orient2d_filter(ax,ay,bx,by,cx,cy):
+    """ orientation() for scalar coordinates, with a floating point filter.
+    The determinant is evaluated in plain double precision, and only when
+    it falls within the error bound (ccwerrboundA) is the adaptive, exact
+    path used.
+    returns -1, 0 or 1, same as orientation(a,b,c)
+    """
+    detleft = (ax - cx) * (by - cy)
+    detright = (ay - cy) * (bx - cx)
+    det = detleft - detright
+    errbound = ccwerrboundA * (abs(detleft) + abs(detright))
+    if det > errbound:
+        return 1
+    elif -det > errbound:
+        return -1
+    return orientation( (ax,ay), (bx,by), (cx,cy) )
+
+def incircle_filter(ax,ay,bx,by,cx,cy,dx,dy):
+    """ incircle() for scalar coordinates, returning only the sign:
+    1 if d is inside the circle through the CCW points a,b,c, -1 if outside,
+    0 if cocircular.  Same floating point filter as incircle(), without
+    any indexing of the inputs.
+    """
+    adx = ax - dx
+    bdx = bx - dx
+    cdx = cx - dx
+    ady = ay - dy
+    bdy = by - dy
+    cdy = cy - dy
+
+    bdxcdy = bdx * cdy
+    cdxbdy = cdx * bdy
+    alift = adx * adx + ady * ady
+
+    cdxady = cdx * ady
+    adxcdy = adx * cdy
+    blift = bdx * bdx + bdy * bdy
+
+    adxbdy = adx * bdy
+    bdxady = bdx * ady
+    clift = cdx * cdx + cdy * cdy
+
+    det = alift * (bdxcdy - cdxbdy) \
+        + blift * (cdxady - adxcdy) \
+        + clift * (adxbdy - bdxady)
+
+    permanent = (abs(bdxcdy) + abs(cdxbdy)) * alift \
+              + (abs(cdxady) + abs(adxcdy)) * blift \
+              + (abs(adxbdy) + abs(bdxady)) * clift
+
+    errbound = iccerrboundA * permanent
+    if det > errbound:
+        return 1
+    elif -det > errbound:
+        return -1
+    det = incircleadapt( (ax,ay), (bx,by), (cx,cy), (dx,dy), permanent)
+    return (det>0) - (det<0)
+
+def orientation_array(pa,pb,pc):
+    """ Vectorized orientation() for arrays of points, shaped [...,2]
+    and broadcast against each other.  Entries where the double precision
+    determinant is within the error bound go through orient2d_filter()
+    one by one.
+    returns an int8 array of -1, 0, 1 with the broadcast shape.
+    """
+    pa,pb,pc=np.broadcast_arrays(*[np.asarray(p,np.float64)
+                                   for p in (pa,pb,pc)])
+    detleft = (pa[...,0] - pc[...,0]) * (pb[...,1] - pc[...,1])
+    detright = (pa[...,1] - pc[...,1]) * (pb[...,0] - pc[...,0])
+    det = detleft - detright
+    errbound = ccwerrboundA * (np.abs(detleft) + np.abs(detright))
+
+    result=np.zeros(det.shape,np.int8)
+    result[det>errbound]=1
+    result[-det>errbound]=-1
+
+    for idx in zip(*np.nonzero(np.abs(det)<=errbound)):
+        args=pa[idx].tolist()+pb[idx].tolist()+pc[idx].tolist()
+        result[idx]=orient2d_filter(*args)
+    return result
+
+def incircle_array(pa,pb,pc,pd):
+    """ Vectorized sign of incircle() for arrays of points, shaped [...,2]
+    and broadcast against each other.  The double precision determinant
+    is evaluated for all entries at once, and only those within the error
+    bound go through the adaptive incircleadapt() one by one.
+    returns an int8 array of -1, 0, 1 with the broadcast shape.
+    """
+    pa,pb,pc,pd=np.broadcast_arrays(*[np.asarray(p,np.float64)
+                                      for p in (pa,pb,pc,pd)])
+    adx = pa[...,0] - pd[...,0]
+    bdx = pb[...,0] - pd[...,0]
+    cdx = pc[...,0] - pd[...,0]
+    ady = pa[...,1] - pd[...,1]
+    bdy = pb[...,1] - pd[...,1]
+    cdy = pc[...,1] - pd[...,1]
+
+    bdxcdy = bdx * cdy
+    cdxbdy = cdx * bdy
+    alift = adx * adx + ady * ady
+
+    cdxady = cdx * ady
+    adxcdy = adx * cdy
+    blift = bdx * bdx + bdy * bdy
+
+    adxbdy = adx * bdy
+    bdxady = bdx * ady
+    clift = cdx * cdx + cdy * cdy
+
+    det = alift * (bdxcdy - cdxbdy) \
+        + blift * (cdxady - adxcdy) \
+        + clift * (adxbdy - bdxady)
+
+    permanent = (np.abs(bdxcdy) + np.abs(cdxbdy)) * alift \
+              + (np.abs(cdxady) + np.abs(adxcdy)) * blift \
+              + (np.abs(adxbdy) + np.abs(bdxady)) * clift
+
+    errbound = iccerrboundA * permanent
+
+    result=np.zeros(det.shape,np.int8)
+    result[det>errbound]=1
+    result[-det>errbound]=-1
+
+    # these have already failed the filter - go straight to the adaptive
+    # stages, reusing the permanent
+    for idx in zip(*np.nonzero(np.abs(det)<=errbound)):
+        det_exact=incircleadapt(pa[idx].tolist(),pb[idx].tolist(),
+                                pc[idx].tolist(),pd[idx].tolist(),
+                                float(permanent[idx]))
+        result[idx]=(det_exact>0) - (det_exact<0)
+    return result
+
 
 if __name__ == '__main__':
     ## Some testing:
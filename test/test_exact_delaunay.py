@@ -49,6 +49,18 @@ def test_adjacent_nodes_dim1():
 
     assert np.all( dt.topo_sort_adjacent_nodes(1,ref_nbr=0)==[0,2] )
     
+def test_adjacent_nodes_topo_geom():
+    # topological and geometric sorts agree for an interior/hull mix
+    np.random.seed(1)
+    dt = Triangulation()
+    for pnt in np.random.random( (50,2) ):
+        dt.add_node( x=pnt )
+    for n in dt.valid_node_iter():
+        ref=dt.node_to_nodes(n)[0]
+        geo=dt.angle_sort_adjacent_nodes(n,ref_nbr=ref,topo=False)
+        topo=dt.angle_sort_adjacent_nodes(n,ref_nbr=ref)
+        assert list(geo)==list(topo)
+
 def test_find_int_elts_dim1():
     dt = Triangulation()
     pnts = [ [0,0],
@@ -272,6 +284,30 @@ def test_incircle():
     assert robust_predicates.incircle(A,B,C,Don) == 0
     assert robust_predicates.incircle(A,B,C,Din) >0
 
+def test_filtered_predicates():
+    # the scalar, filtered versions agree in sign with the originals,
+    # including the exactly degenerate cases on a lattice
+    pnts=[ [x,y] for x in [0,0.1,0.3,1e-20] for y in [0,0.1,0.2,1e20] ]
+    np.random.seed(3)
+    for i in range(300):
+        a,b,c,d=[pnts[k] for k in np.random.randint(0,len(pnts),4)]
+        o=robust_predicates.orientation(a,b,c)
+        assert o==robust_predicates.orient2d_filter(a[0],a[1],b[0],b[1],c[0],c[1])
+        ic=robust_predicates.incircle(a,b,c,d)
+        ic=(ic>0)-(ic<0)
+        assert ic==robust_predicates.incircle_filter(a[0],a[1],b[0],b[1],
+                                                     c[0],c[1],d[0],d[1])
+
+    # and the vectorized versions agree with the scalar ones
+    P=np.array(pnts)[np.random.randint(0,len(pnts),(300,4))]
+    o_arr=robust_predicates.orientation_array(P[:,0],P[:,1],P[:,2])
+    ic_arr=robust_predicates.incircle_array(P[:,0],P[:,1],P[:,2],P[:,3])
+    for i in range(len(P)):
+        a,b,c,d=P[i].tolist()
+        assert o_arr[i]==robust_predicates.orient2d_filter(a[0],a[1],b[0],b[1],c[0],c[1])
+        assert ic_arr[i]==robust_predicates.incircle_filter(a[0],a[1],b[0],b[1],
+                                                            c[0],c[1],d[0],d[1])
+
 # testing dim_down
 def test_test_dim_down():
     dt = Triangulation()
@@ -397,8 +433,26 @@ def test_delete3():
         dt.plot_edges(alpha=0.5,lw=2)
         dt.plot_cells(lw=13,facecolor='#ddddff',edgecolor='w',zorder=-5)
 
+def test_renumber():
+    dt = Triangulation()
+    for xy in [ [0,0],[10,0],[10,10],[0,10],[5,5],[3,7] ]:
+        dt.add_node( x=xy )
+    # populate the nodes_to_edge map before renumbering
+    for j in dt.valid_edge_iter():
+        assert dt.nodes_to_edge(dt.edges['nodes'][j])==j
+
+    dt.delete_node(4)
+    dt.renumber_nodes()
+    dt.renumber_edges()
 
-## 
+    for j in dt.valid_edge_iter():
+        assert dt.nodes_to_edge(dt.edges['nodes'][j])==j
+    # locating a new node starts from the renumbered nodes
+    dt.add_node( x=[6,2] )
+    assert len(dt.check_global_delaunay())==0
+
+
+##
 
 def test_flip2():
     plot=False
@@ -580,7 +634,66 @@ def test_move1():
     dt.check_global_delaunay()
     return dt
 
-## 
+def test_nodes_to_edge():
+    # hash lookup stays in sync through inserts, flips, deletes and moves
+    np.random.seed(2)
+    dt = Triangulation()
+    for pnt in np.random.random( (60,2) ):
+        dt.add_node( x=pnt )
+    dt.delete_node(5)
+    dt.modify_node(10,x=[0.3,0.31])
+
+    for j in dt.valid_edge_iter():
+        a,b=dt.edges['nodes'][j]
+        assert dt.nodes_to_edge(a,b)==j
+        assert dt.nodes_to_edge([b,a])==j
+    assert dt.nodes_to_edge(0,5) is None
+
+def test_add_constraints():
+    np.random.seed(6)
+    dt = Triangulation()
+    for pnt in np.random.random( (50,2) ):
+        dt.add_node( x=pnt )
+    # a polyline through nodes far apart, sharing endpoints
+    segs=np.array( [[0,1],[1,2],[2,3]] )
+    dt.add_constraints(segs)
+    for a,b in segs:
+        j=dt.nodes_to_edge(a,b)
+        assert j is not None
+        assert dt.edges['constrained'][j]
+    assert len(dt.check_local_delaunay())==0
+
+def test_halfedge_nbr():
+    # stepping within a cell agrees with the node-sorting traversal
+    np.random.seed(4)
+    dt = Triangulation()
+    for pnt in np.random.random( (40,2) ):
+        dt.add_node( x=pnt )
+    for j in dt.valid_edge_iter():
+        for orient in [0,1]:
+            he=dt.halfedge(j,orient)
+            for direc in [0,1]:
+                assert dt.halfedge_nbr(he,direc) == he.nbr(direc)
+
+def test_bulk_init():
+    np.random.seed(5)
+    pnts=np.random.random( (200,2) )
+    dt = Triangulation()
+    dt.bulk_init(pnts)
+    assert len(dt.check_global_delaunay())==0
+
+    for c in dt.valid_cell_iter():
+        for i,j in enumerate(dt.cells['edges'][c]):
+            a=dt.cells['nodes'][c,i]
+            b=dt.cells['nodes'][c,(i+1)%3]
+            assert set(dt.edges['nodes'][j])==set([a,b])
+            assert c in dt.edges['cells'][j]
+    # and it stays usable for incremental work
+    dt.add_node(x=[0.5,0.501])
+    dt.delete_node(10)
+    assert len(dt.check_global_delaunay())==0
+
+##
         
 if 0:
     test_find_intersected_elements()
@@ -38,6 +38,13 @@ def test_curve_eval():
         crvX=crv(f)
         plt.plot(crvX[:,0],crvX[:,1],'ro')
 
+def test_curve_eval_scalar():
+    crv=hex_curve()
+    f=np.linspace(-crv.total_distance(),2*crv.total_distance(),37)
+    crvX=crv(f)
+    for fi,Xi in zip(f,crvX):
+        assert np.allclose( crv.eval_scalar(fi), Xi )
+
 def test_distance_away():
     crv=hex_curve()
 
@@ -72,6 +79,13 @@ def test_is_forward():
     assert crv.is_forward(5,6,50)
     assert crv.is_reverse(5,-5,10)
 
+def test_site_angles():
+    xy=np.random.random((20,2))
+    abc=np.array([np.random.permutation(20)[:3] for i in range(50)])
+    angles=front.site_angles(xy,abc)
+    for (a,b,c),angle in zip(abc,angles):
+        assert np.allclose(angle, front.internal_angle(xy[a],xy[b],xy[c]))
+
 
 
 #-# 
@@ -116,6 +130,18 @@ def test_basic_setup():
     return af
 
 
+def test_ring_step():
+    af=test_basic_setup()
+    g=af.grid
+    # a few cells, so that some nodes have degree >2
+    af.loop(5)
+    for j in g.valid_edge_iter():
+        for orient in [0,1]:
+            he=g.halfedge(j,orient)
+            a,b=he.node_rev(),he.node_fwd()
+            assert af.ring_step(a,b,1)==he.fwd().node_fwd()
+            assert af.ring_step(b,a,-1)==he.rev().node_rev()
+
 # Going to try more of a half-edge approach, rather than explicitly
 # tracking the unpaved rings.
 # hoping that a half-edge interface is sufficient for the paver, and
@@ -251,6 +277,17 @@ def test_resample_neighbors():
 #  try this as a separate class for each strategy, but they are all singletons
 
 
+def test_choose_site_incremental():
+    # choose_site only rescores sites near edits - check that it still
+    # agrees with scoring every site from scratch.
+    af=test_basic_setup()
+    for step in range(10):
+        site=af.choose_site()
+        abc=af.enumerate_site_nodes()
+        angles=front.site_angles(af.grid.nodes['x'],abc)
+        assert list(site.abc)==list(abc[np.argmin(angles)])
+        af.advance_at_site(site)
+
 def test_actions():
     af=test_basic_setup()
 
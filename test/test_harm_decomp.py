@@ -0,0 +1,165 @@
+from __future__ import print_function
+
+import numpy as np
+
+from stompy import harm_decomp
+
+
+def reset_cache():
+    harm_decomp.decompose.cached_t=None
+    harm_decomp.decompose.cached_omegas=None
+    harm_decomp.decompose.col_cache.clear()
+
+def synthetic(t,omegas,seed=0):
+    rng=np.random.RandomState(seed)
+    amps=rng.uniform(0.2,1.0,len(omegas))
+    phis=rng.uniform(-np.pi,np.pi,len(omegas))
+    h=sum( a*np.cos(w*t-p) for a,w,p in zip(amps,omegas,phis) )
+    return h,amps,phis
+
+def lstsq_comps(t,h,omegas):
+    """ reference amplitudes and phases from a plain least squares fit """
+    A=np.column_stack( [f(w*t) for w in omegas for f in (np.cos,np.sin)] )
+    x=np.linalg.lstsq(A,h,rcond=None)[0]
+    x=x.reshape( (len(omegas),2)+x.shape[1:] )
+    return np.hypot(x[:,0],x[:,1]), np.arctan2(x[:,1],x[:,0])
+
+def check_comps(comps,t,h,omegas,atol=1e-8):
+    amps,phis=lstsq_comps(t,h,omegas)
+    assert np.allclose(comps[:,0],amps,atol=atol)
+    # compare phases through the fitted signal, avoiding wrap-around
+    assert np.allclose(amps*np.cos(comps[:,1]-phis),amps,atol=atol)
+
+# a few hours apart, so a couple of days of hourly data resolves them
+omegas=2*np.pi/3600. * np.array([1/12.42,1/12.0,1/25.82,1/23.93])
+
+def test_uneven_cholesky():
+    reset_cache()
+    t=np.sort(np.random.RandomState(1).uniform(0,10*86400,800))
+    h,amps,phis=synthetic(t,omegas)
+    comps=harm_decomp.decompose(t,h,omegas)
+    assert harm_decomp.decompose.cached_solver[1] is not None
+    check_comps(comps,t,h,omegas)
+    assert np.allclose(comps[:,0],amps)
+
+def test_uniform_closed_form():
+    reset_cache()
+    t=np.arange(0,10*86400,600.)
+    h,amps,phis=synthetic(t,omegas)
+    assert harm_decomp.uniform_spacing(t)==600.
+    comps=harm_decomp.decompose(t,h,omegas)
+    assert harm_decomp.decompose.cached_solver[1] is not None
+    check_comps(comps,t,h,omegas)
+
+    # closed form normal matrix agrees with forming it directly
+    A=harm_decomp.decompose.cached_solver[0]
+    AtA=harm_decomp.uniform_normal_matrix(t[0],600.,len(t),omegas)
+    assert np.allclose(AtA,np.dot(A.T,A),atol=1e-8*len(t))
+
+def test_qr_fallback():
+    reset_cache()
+    # nearly unresolved pair of frequencies, too poorly conditioned for
+    # the normal equations
+    t=np.sort(np.random.RandomState(2).uniform(0,100,500))
+    pair=[1.0,1+1e-8]
+    h=np.cos(t)+0.5*np.sin((1+1e-8)*t)
+    comps=harm_decomp.decompose(t,h,pair)
+    assert harm_decomp.decompose.cached_solver[1] is None
+    assert harm_decomp.decompose.cached_solver[2] is not None
+    assert np.allclose(harm_decomp.recompose(t,comps,pair),h,atol=1e-6)
+
+    # and on a well-conditioned basis, the QR solve matches lstsq
+    h,amps,phis=synthetic(t,[1.0,2.0,3.0])
+    A=np.column_stack( [f(w*t) for w in [1.0,2.0,3.0] for f in (np.cos,np.sin)] )
+    x=harm_decomp.qr_solve(harm_decomp.qr_factor(A),h)
+    assert np.allclose(x,np.linalg.lstsq(A,h,rcond=None)[0])
+
+def test_float32():
+    reset_cache()
+    t=np.arange(0,30*86400,900.)
+    h,amps,phis=synthetic(t,omegas)
+    h+=10.0 # typical datum offset
+    w=np.concatenate( ([0.0],omegas) )
+    comps64=harm_decomp.decompose(t,h,w).copy()
+    comps32=harm_decomp.decompose(t,h,w,dtype=np.float32)
+    assert harm_decomp.decompose.cached_solver[0].dtype==np.float32
+    assert comps32.dtype==np.float64
+    assert np.allclose(comps32[:,0],comps64[:,0],rtol=1e-6,atol=1e-6)
+    check_comps(comps64,t,h,w)
+
+def test_multiple_series():
+    reset_cache()
+    t=np.arange(0,10*86400,1800.)
+    hs=np.column_stack( [synthetic(t,omegas,seed=s)[0] for s in range(3)] )
+    comps=harm_decomp.decompose(t,hs,omegas)
+    assert comps.shape==(len(omegas),2,3)
+    for k in range(3):
+        check_comps(comps[:,:,k],t,hs[:,k],omegas)
+        assert np.allclose(comps[:,:,k],harm_decomp.decompose(t,hs[:,k],omegas))
+
+def test_column_cache():
+    reset_cache()
+    t=np.sort(np.random.RandomState(3).uniform(0,10*86400,600))
+    h,amps,phis=synthetic(t,omegas)
+    harm_decomp.decompose(t,h,omegas)
+    # subsets and reorderings reuse the cached columns
+    for w in [omegas[:2],omegas[::-1],omegas[1:3]]:
+        comps=harm_decomp.decompose(t,h,w)
+        for i,omega in enumerate(w):
+            cols=harm_decomp.decompose.col_cache[(omega,'d')]
+            A=harm_decomp.decompose.cached_solver[0]
+            assert np.all(cols==A[:,2*i:2*i+2])
+        check_comps(comps,t,h,w)
+
+    # nothing beyond the current basis is held when the budget is 0
+    old=harm_decomp.decompose.col_cache_bytes
+    try:
+        harm_decomp.decompose.col_cache_bytes=0
+        harm_decomp.decompose(t,h,omegas[:1])
+        assert len(harm_decomp.decompose.col_cache)==1
+    finally:
+        harm_decomp.decompose.col_cache_bytes=old
+
+def test_t_modified_in_place():
+    reset_cache()
+    t=np.linspace(0,100,1000)
+    w=[1.0,2.0]
+    t.flags.writeable=False
+    comps=harm_decomp.decompose(t,np.cos(t),w)
+    assert np.allclose(comps[:,0],[1,0])
+    t.flags.writeable=True
+    t*=2
+    t.flags.writeable=False
+    comps=harm_decomp.decompose(t,np.cos(t),w)
+    assert np.allclose(comps[:,0],[1,0])
+
+def test_goertzel():
+    reset_cache()
+    t=np.arange(0,60*86400,900.)
+    h,amps,phis=synthetic(t,omegas)
+    comps=harm_decomp.decompose_goertzel(t,h,omegas)
+    # a projection, so only approximately the joint fit
+    check_comps(comps,t,h,omegas,atol=2e-2)
+    # direct DFT of each frequency
+    for i,w in enumerate(omegas):
+        Z=np.sum(h*np.exp(-1j*w*t))
+        assert np.allclose(comps[i,0],2*np.abs(Z)/len(t))
+
+def test_goertzel_uneven():
+    t=np.array([0.,1.,3.])
+    try:
+        harm_decomp.decompose_goertzel(t,np.ones(3),[1.0])
+    except ValueError:
+        pass
+    else:
+        assert False,"uneven t should raise ValueError"
+
+def test_recompose_integers():
+    t=np.arange(20)
+    comps=np.array([[1.0,0.5],[2.0,-1.0]])
+    w=[1,2]
+    expected=sum( comps[i,0]*np.cos(w[i]*t-comps[i,1]) for i in range(2) )
+    assert np.allclose(harm_decomp.recompose(t,comps,w),expected)
+    assert np.allclose(harm_decomp.recompose(t,comps.astype(np.int64),w),
+                       sum( int(comps[i,0])*np.cos(w[i]*t-int(comps[i,1]))
+                            for i in range(2) ))
@@ -2,6 +2,8 @@ from __future__ import print_function
 
 import numpy as np
 import os
+import shutil
+import tempfile
 import nose
 from nose.tools import assert_raises
 
@@ -139,8 +141,13 @@ def test_pickle():
 
     j1=ug.add_edge(nodes=[n1,n2])
 
-    ug.write_pickle('blah.pkl')
-    ug2=unstructured_grid.UnstructuredGrid.from_pickle('blah.pkl')
+    tmp_dir=tempfile.mkdtemp()
+    try:
+        fn=os.path.join(tmp_dir,'blah.pkl')
+        ug.write_pickle(fn)
+        ug2=unstructured_grid.UnstructuredGrid.from_pickle(fn)
+    finally:
+        shutil.rmtree(tmp_dir)
 
 
 ## 